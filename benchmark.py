@@ -0,0 +1,340 @@
+import json
+import os
+import random
+import re
+import resource
+import sqlite3
+import string
+import threading
+import BaseHTTPServer
+import SocketServer
+
+import importmysql
+from schema import Index
+
+DEFAULT_ROWS = 10000
+NULL_FRACTION = 0.1
+TEXT_LENGTH = 200
+
+int_type_re = re.compile(r"(tiny|small|medium|big)?int\b")
+char_type_re = re.compile(r"(var)?char\((?P<length>\d+)\)")
+default_re = re.compile(r"DEFAULT ('(?P<quoted>[^']*)'|(?P<bare>\S+))")
+left_re = re.compile(r"\bLEFT\((`[^`]+`), ")
+
+# A SQLite database standing in for the MySQL server: information_schema
+# lives in an attached side file and the few MySQL-only constructs the
+# importer uses are provided as SQL functions or rewritten by the cursor.
+
+def info_schema_file(filename):
+    return filename + ".information_schema"
+
+def connect_sqlite(db):
+    conn = sqlite3.connect(db, check_same_thread=False)
+    conn.execute("ATTACH DATABASE ? AS information_schema", (info_schema_file(db),))
+    conn.create_function("DATABASE", 0, lambda: "main")
+    return SQLiteConnection(conn)
+
+class SQLiteConnection:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def cursor(self, cursorclass=None):
+        return SQLiteCursor(self.conn.cursor())
+
+    def close(self):
+        self.conn.close()
+
+class SQLiteCursor:
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.description = None
+
+    def execute(self, query, args=None):
+        if query.startswith("SHOW SESSION STATUS"):
+            query, args = "SELECT 'Bytes_sent', 0", None
+        # LEFT is a keyword in SQLite, so it can not be a function there.
+        query = left_re.sub(r"SUBSTR(\1, 1, ", query)
+        self.cursor.execute(query.replace("%s", "?"), args or ())
+        self.description = self.cursor.description
+
+    def fetchone(self):
+        return self.cursor.fetchone()
+
+    def fetchmany(self, size):
+        return self.cursor.fetchmany(size)
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+def generate_database(schema, filename, n_rows, seed=0):
+    rand = random.Random(seed)
+    for f in (filename, info_schema_file(filename)):
+        if os.path.exists(f):
+            os.remove(f)
+
+    conn = connect_sqlite(filename).conn
+    conn.execute("CREATE TABLE information_schema.tables (table_schema, "
+                 "table_name, table_rows, data_length)")
+    write_information_schema(conn, schema)
+
+    for table in schema.tables.values():
+        if not table.include: continue
+        columns = table.columns.values()
+        conn.execute("CREATE TABLE `%s` (%s)" % (table.name, ", ".join(
+                    "`%s` %s%s" % (col.name, col.mysql_type,
+                                   " PRIMARY KEY" if col.name == table.primary_key else "")
+                    for col in columns)))
+
+        generators = [column_generator(rand, schema, table, col, n_rows)
+                      for col in columns]
+        insert = "INSERT INTO `%s` VALUES (%s)" % (table.name,
+                                                   ", ".join("?" for col in columns))
+        nbytes = [0]
+        def rows():
+            for i in xrange(1, n_rows + 1):
+                row = [generate(i) for generate in generators]
+                nbytes[0] += sum(len(unicode(v)) for v in row if v is not None)
+                yield row
+        conn.executemany(insert, rows())
+        conn.execute("INSERT INTO information_schema.tables VALUES ('main', ?, ?, ?)",
+                     (table.name, n_rows, nbytes[0]))
+    conn.commit()
+    conn.close()
+
+def write_information_schema(conn, schema):
+    # Enough of information_schema for reflect_schema to rebuild the schema.
+    conn.execute("CREATE TABLE information_schema.columns (table_schema, "
+                 "table_name, column_name, ordinal_position, column_type, "
+                 "is_nullable, column_default, extra)")
+    conn.execute("CREATE TABLE information_schema.statistics (table_schema, "
+                 "table_name, index_name, non_unique, seq_in_index, column_name)")
+    conn.execute("CREATE TABLE information_schema.key_column_usage (table_schema, "
+                 "table_name, constraint_name, column_name, ordinal_position, "
+                 "referenced_table_name, referenced_column_name)")
+
+    for table in schema.tables.values():
+        if not table.include: continue
+        for i, col in enumerate(table.columns.values()):
+            options = col.options.upper()
+            match = default_re.search(col.options)
+            default = None
+            if match is not None and match.group("bare") != "NULL":
+                default = match.group("quoted") if match.group("quoted") is not None \
+                    else match.group("bare")
+            extra = "auto_increment" if "AUTO_INCREMENT" in options else ""
+            conn.execute("INSERT INTO information_schema.columns VALUES "
+                         "('main', ?, ?, ?, ?, ?, ?, ?)",
+                         (table.name, col.name, i + 1, col.mysql_type,
+                          "NO" if "NOT NULL" in options else "YES", default, extra))
+
+        indexes = table.indexes.values()
+        if table.primary_key is not None and "PRIMARY" not in table.indexes:
+            indexes = indexes + [Index("PRIMARY", [table.primary_key], primary=True)]
+        for index in indexes:
+            for i, column in enumerate(index.columns):
+                conn.execute("INSERT INTO information_schema.statistics VALUES "
+                             "('main', ?, ?, ?, ?, ?)",
+                             (table.name, index.name, 0 if index.unique else 1,
+                              i + 1, column))
+
+        for rel in table.relationships.values():
+            for i, (local, remote) in enumerate(zip(rel.local_columns,
+                                                    rel.remote_columns)):
+                conn.execute("INSERT INTO information_schema.key_column_usage "
+                             "VALUES ('main', ?, ?, ?, ?, ?, ?)",
+                             (table.name, rel.name, local, i + 1, rel.table, remote))
+
+def column_generator(rand, schema, table, col, n_rows):
+    mysql_type = col.mysql_type.lower()
+    nullable = "NOT NULL" not in col.options.upper()
+
+    if col.name == table.primary_key:
+        return lambda i: i
+
+    if col.name in table.relationships:
+        rel = table.relationships[col.name]
+        remote = schema.tables.get(rel.table)
+        if remote is not None and remote.include:
+            generate = lambda i: rand.randint(1, n_rows)
+        else:
+            generate = lambda i: None
+    elif int_type_re.match(mysql_type):
+        generate = lambda i: rand.randint(0, 1000000)
+    elif mysql_type.startswith(("decimal", "double", "float")):
+        generate = lambda i: round(rand.uniform(0, 10000), 2)
+    elif mysql_type.startswith("bit"):
+        generate = lambda i: rand.randint(0, 1)
+    elif mysql_type.startswith("datetime") or mysql_type.startswith("timestamp"):
+        generate = lambda i: "2013-%02d-%02dT12:00:00" % (rand.randint(1, 12),
+                                                          rand.randint(1, 28))
+    elif mysql_type.startswith("date"):
+        generate = lambda i: "2013-%02d-%02d" % (rand.randint(1, 12),
+                                                 rand.randint(1, 28))
+    elif importmysql.is_large(col):
+        generate = lambda i: random_text(rand, TEXT_LENGTH)
+    else:
+        match = char_type_re.match(mysql_type)
+        length = int(match.group("length")) if match else 32
+        generate = lambda i: random_text(rand, rand.randint(1, min(length, 64)))
+
+    if not nullable:
+        return generate
+    return lambda i: None if rand.random() < NULL_FRACTION else generate(i)
+
+def random_text(rand, length):
+    return "".join(rand.choice(string.ascii_letters) for i in xrange(length))
+
+# A local stand-in for CouchDB: accepts _bulk_docs, answers _all_docs and
+# keeps documents in memory so conflicts and deferred passes behave.
+
+class FakeCouchHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_HEAD(self):
+        self.respond(200, "")
+
+    def do_GET(self):
+        self.respond(200, json.dumps({"db_name": self.path.strip("/")}))
+
+    def do_PUT(self):
+        self.respond(201, json.dumps({"ok": True}))
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        docs = self.server.docs
+        if self.path.endswith("/_bulk_docs"):
+            results = []
+            with self.server.lock:
+                for doc in request["docs"]:
+                    doc_id = doc.get("_id") or os.urandom(16).encode("hex")
+                    current = docs.get(doc_id)
+                    if current is not None and current["_rev"] != doc.get("_rev"):
+                        results.append({"id": doc_id, "error": "conflict",
+                                        "reason": "Document update conflict."})
+                        continue
+                    generation = int(current["_rev"].split("-")[0]) if current else 0
+                    doc["_id"], doc["_rev"] = doc_id, "%d-fake" % (generation + 1)
+                    docs[doc_id] = doc
+                    results.append({"id": doc_id, "rev": doc["_rev"]})
+            self.respond(201, json.dumps(results))
+        elif "/_all_docs" in self.path:
+            include_docs = "include_docs=true" in self.path
+            rows = []
+            for key in request["keys"]:
+                doc = docs.get(key)
+                if doc is None:
+                    rows.append({"key": key, "error": "not_found"})
+                else:
+                    rows.append({"id": key, "key": key, "value": {"rev": doc["_rev"]},
+                                 "doc": doc if include_docs else None})
+            self.respond(200, json.dumps({"rows": rows}))
+        else:
+            self.respond(404, json.dumps({"error": "not_found"}))
+
+    def respond(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class FakeCouchServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address):
+        BaseHTTPServer.HTTPServer.__init__(self, address, FakeCouchHandler)
+        self.docs = {}
+        self.lock = threading.Lock()
+
+def start_fake_couch():
+    # Served from its own process so it does not count towards peak memory.
+    from multiprocessing import Process, Pipe
+
+    parent, child = Pipe()
+    def serve():
+        server = FakeCouchServer(("127.0.0.1", 0))
+        child.send(server.server_address[1])
+        server.serve_forever()
+
+    process = Process(target=serve)
+    process.daemon = True
+    process.start()
+    return process, "http://127.0.0.1:%d/" % parent.recv()
+
+def peak_memory_kb(who=resource.RUSAGE_SELF):
+    return resource.getrusage(who).ru_maxrss
+
+def run_benchmark(schema, db, workers=1, streaming=False, chunk_size=None,
+                  fast=False):
+    server, url = start_fake_couch()
+    try:
+        couch_args = dict(couchdbname="benchmark", server_url=url, fast=fast)
+        if workers > 1:
+            run = importmysql.convert_parallel(dict(db=db), couch_args, schema,
+                                               workers, streaming, chunk_size,
+                                               connect=connect_sqlite)
+        else:
+            run = importmysql.convert(connect_sqlite(db),
+                                      importmysql.connect_couch(**couch_args),
+                                      schema, streaming, chunk_size=chunk_size)
+        # Measured before the server exits: only waited-for children
+        # (the finished pool workers) show up in RUSAGE_CHILDREN.
+        report = run.as_dict()
+        report["run"]["peak_memory_kb"] = peak_memory_kb()
+        report["run"]["peak_worker_memory_kb"] = peak_memory_kb(resource.RUSAGE_CHILDREN)
+    finally:
+        server.terminate()
+    report["settings"] = {"workers": workers,
+                          "streaming": streaming,
+                          "chunk_size": chunk_size,
+                          "fast": fast,
+                          "batch_size": importmysql.BATCH_SIZE,
+                          "batch_bytes": importmysql.BATCH_BYTES,
+                          "write_concurrency": importmysql.WRITE_CONCURRENCY,
+                          "large_column_policy": importmysql.LARGE_COLUMN_POLICY,
+                          "truncate_length": importmysql.TRUNCATE_LENGTH}
+    return report
+
+if __name__ == "__main__":
+    import getopt
+    import sys
+    import tempfile
+    from jsonschema import load_json_schema
+
+    optlist, args = getopt.getopt(sys.argv[1:], 'n:d:gj:sc:fb:w:l:m:')
+    options = dict(optlist)
+    schema = load_json_schema(args[0])
+    db = options.get("-d") or os.path.join(tempfile.gettempdir(),
+                                           "importmysql-benchmark.sqlite")
+
+    if "-g" in options or not os.path.exists(db):
+        n_rows = int(options.get("-n", DEFAULT_ROWS))
+        print "generating %d rows per table into %s" % (n_rows, db)
+        generate_database(schema, db, n_rows)
+
+    if "-b" in options:
+        importmysql.BATCH_BYTES = int(options["-b"])
+    if "-w" in options:
+        importmysql.WRITE_CONCURRENCY = int(options["-w"])
+    if "-l" in options:
+        policy, _, length = options["-l"].partition(":")
+        if policy not in importmysql.LARGE_COLUMN_POLICIES:
+            sys.exit("unknown large column policy: %s" % policy)
+        importmysql.LARGE_COLUMN_POLICY = policy
+        if length:
+            importmysql.TRUNCATE_LENGTH = int(length)
+
+    report = run_benchmark(schema, db,
+                           workers=int(options.get("-j", 1)),
+                           streaming="-s" in options,
+                           chunk_size=int(options["-c"]) if "-c" in options else None,
+                           fast="-f" in options)
+
+    print "rows/s: %.0f, peak memory: %.1f MB" % (
+        report["run"]["rows_per_second"], report["run"]["peak_memory_kb"] / 1024.0)
+    if "-m" in options:
+        with open(options["-m"], "w") as out:
+            json.dump(report, out, indent=4)
@@ -0,0 +1,344 @@
+import base64
+import httplib
+import json
+import socket
+import threading
+import time
+import urlparse
+import Queue
+from cStringIO import StringIO
+
+import couchdb
+
+from pipeline import Pipeline
+
+INITIAL_BATCH_BYTES = 1 << 20
+MIN_BATCH_BYTES = 32 << 10
+MAX_BATCH_BYTES = 32 << 20
+TARGET_LATENCY = 1.0
+MAX_RETRIES = 5
+RETRY_DELAY = 0.5
+TRANSIENT_STATUSES = (408, 429, 500, 502, 503, 504)
+
+class BatchBudget:
+    def __init__(self, initial=INITIAL_BATCH_BYTES, target_latency=TARGET_LATENCY):
+        self.nbytes = initial
+        self.target_latency = target_latency
+
+    def observe(self, nbytes, latency):
+        # Back off hard on slow responses, grow gently on fast ones.
+        if latency > self.target_latency:
+            self.nbytes = max(MIN_BATCH_BYTES, self.nbytes // 2)
+        elif nbytes >= self.nbytes and latency < self.target_latency / 2:
+            self.nbytes = min(MAX_BATCH_BYTES, self.nbytes * 5 // 4)
+
+class BatchStats:
+    def __init__(self):
+        self.requests = 0
+        self.docs = 0
+        self.nbytes = 0
+        self.latency = 0.0
+        self.min_docs = None
+        self.max_docs = 0
+
+    def add(self, ndocs, nbytes, latency):
+        self.requests += 1
+        self.docs += ndocs
+        self.nbytes += nbytes
+        self.latency += latency
+        self.min_docs = ndocs if self.min_docs is None else min(self.min_docs, ndocs)
+        self.max_docs = max(self.max_docs, ndocs)
+
+    def __str__(self):
+        if self.requests < 1:
+            return "no requests"
+        return ("%d requests, docs/request min %d mean %d max %d, "
+                "%.1f KB/request, %.3f s/request") % (
+            self.requests, self.min_docs, self.docs // self.requests,
+            self.max_docs, self.nbytes / 1024.0 / self.requests,
+            self.latency / self.requests)
+
+class BulkWriter:
+    def __init__(self, sink, budget=None, on_commit=None):
+        if not hasattr(sink, "encode"):
+            sink = DatabaseSink(sink)
+        self.sink = sink
+        self.budget = budget or BatchBudget()
+        self.on_commit = on_commit
+        self.stats = BatchStats()
+        self.pending = []
+        self.pending_docs = []
+        self.pending_bytes = 0
+
+    def add(self, docs):
+        encode = self.sink.encode
+        for doc in docs:
+            item, nbytes = encode(doc)
+            self.pending.append(item)
+            self.pending_docs.append(doc)
+            self.pending_bytes += nbytes
+            if self.pending_bytes >= self.budget.nbytes:
+                self.send_pending()
+
+    def send_pending(self):
+        if not self.pending: return
+        batch = (self.pending, self.pending_docs, self.pending_bytes)
+        self.pending, self.pending_docs, self.pending_bytes = [], [], 0
+        self.send(*batch)
+
+    def send(self, items, docs, nbytes):
+        start = time.time()
+        self.write(items, docs)
+        latency = time.time() - start
+
+        self.budget.observe(nbytes, latency)
+        self.stats.add(len(items), nbytes, latency)
+        if self.on_commit is not None:
+            self.on_commit(docs[-1])
+
+    def write(self, items, docs):
+        # Transient request failures and conflicting documents are retried
+        # independently, each up to MAX_RETRIES times. A conflict is a
+        # document stored by an earlier, interrupted run or another writer;
+        # it is overwritten against its current revision.
+        sink = self.sink
+        failures = conflict_rounds = 0
+        while True:
+            try:
+                conflicts = conflicting_docs(sink.bulk_docs(items), docs)
+                if not conflicts:
+                    return
+                if conflict_rounds == MAX_RETRIES:
+                    raise BulkDocsError("%d documents still conflicting after %d "
+                                        "retries" % (len(conflicts), MAX_RETRIES))
+                conflict_rounds += 1
+
+                # Retry just the conflicting documents against their current revisions.
+                docs = with_revisions(conflicts, sink.revisions(
+                        [doc["_id"] for doc in conflicts]))
+                items = [sink.encode(doc)[0] for doc in docs]
+            except Exception, e:
+                if failures == MAX_RETRIES or not is_transient(e): raise
+                time.sleep(RETRY_DELAY * 2 ** failures)
+                failures += 1
+
+    def flush(self):
+        self.send_pending()
+
+    def close(self):
+        self.flush()
+
+    def abort(self):
+        pass
+
+class ConcurrentWriter(BulkWriter):
+    def __init__(self, sink, concurrency, budget=None, on_commit=None):
+        BulkWriter.__init__(self, sink, budget, on_commit)
+        self.lock = threading.Condition()
+        self.pipeline = Pipeline(concurrency)
+        self.batches = self.pipeline.queue()
+        self.sent = 0
+        self.completed = {}
+        self.committed = 0
+        for i in range(concurrency):
+            self.pipeline.start(self.sender)
+
+    def send(self, items, docs, nbytes):
+        # The bounded queue blocks the reader once `concurrency` batches are
+        # waiting, on top of the ones in flight.
+        if self.pipeline.stopped.is_set():
+            self.pipeline.join()
+        self.pipeline.put(self.batches, (self.sent, items, docs, nbytes))
+        self.sent += 1
+
+    def sender(self):
+        while True:
+            batch = self.pipeline.get(self.batches)
+            if batch is None: return
+            seq, items, docs, nbytes = batch
+
+            start = time.time()
+            self.write(items, docs)
+            latency = time.time() - start
+
+            with self.lock:
+                self.budget.observe(nbytes, latency)
+                self.stats.add(len(items), nbytes, latency)
+                self.completed[seq] = docs[-1]
+                # Batches finish out of order; only commit a contiguous prefix.
+                last_doc = None
+                while self.committed in self.completed:
+                    last_doc = self.completed.pop(self.committed)
+                    self.committed += 1
+                if last_doc is not None and self.on_commit is not None:
+                    self.on_commit(last_doc)
+                self.lock.notify_all()
+
+    def flush(self):
+        self.send_pending()
+        with self.lock:
+            while self.committed < self.sent and not self.pipeline.stopped.is_set():
+                self.lock.wait(0.1)
+        if self.pipeline.errors:
+            self.pipeline.join()
+
+    def close(self):
+        self.flush()
+        for i in range(len(self.pipeline.threads)):
+            self.pipeline.put(self.batches, None)
+        self.pipeline.join()
+
+    def abort(self):
+        self.pipeline.stopped.set()
+
+def conflicting_docs(failures, docs):
+    conflicts = []
+    for index, error, reason in failures:
+        if error != "conflict":
+            raise BulkDocsError("%s: %s: %s" % (docs[index].get("_id"), error, reason))
+        conflicts.append(docs[index])
+    return conflicts
+
+def with_revisions(docs, revisions):
+    result = []
+    for doc in docs:
+        doc = dict(doc)
+        if doc["_id"] in revisions:
+            doc["_rev"] = revisions[doc["_id"]]
+        else:
+            doc.pop("_rev", None)
+        result.append(doc)
+    return result
+
+def is_transient(error):
+    if isinstance(error, (socket.error, httplib.HTTPException,
+                          couchdb.http.ServerError)):
+        return True
+    return isinstance(error, BulkDocsError) and error.status in TRANSIENT_STATUSES
+
+class DatabaseSink:
+    def __init__(self, couch):
+        self.couch = couch
+
+    def encode(self, doc):
+        return doc, len(json.dumps(doc)) + 1
+
+    def fetch(self, ids):
+        return dict((row.id, row.doc)
+                    for row in self.couch.view("_all_docs", keys=ids,
+                                               include_docs=True)
+                    if row.doc is not None)
+
+    def revisions(self, ids):
+        return dict((row.id, row.value["rev"])
+                    for row in self.couch.view("_all_docs", keys=ids)
+                    if row.value is not None)
+
+    def bulk_docs(self, docs):
+        failures = []
+        for index, (success, docid, error) in enumerate(self.couch.update(docs)):
+            if success: continue
+            if isinstance(error, couchdb.http.ResourceConflict):
+                failures.append((index, "conflict", str(error)))
+            else:
+                failures.append((index, error.__class__.__name__, str(error)))
+        return failures
+
+class BulkDocsError(Exception):
+    def __init__(self, message, status=None):
+        Exception.__init__(self, message)
+        self.status = status
+
+encode_json = json.JSONEncoder(separators=(",", ":")).encode
+
+class HttpSink:
+    def __init__(self, url, connections=1):
+        parts = urlparse.urlsplit(url)
+        self.path = parts.path.rstrip("/")
+        self.headers = {"Content-Type": "application/json",
+                        "Accept": "application/json",
+                        "Connection": "keep-alive"}
+        if parts.username is not None:
+            credentials = "%s:%s" % (urlparse.unquote(parts.username),
+                                     urlparse.unquote(parts.password or ""))
+            self.headers["Authorization"] = "Basic " + base64.b64encode(credentials)
+        self.pool = ConnectionPool(parts.scheme, parts.hostname, parts.port,
+                                   connections)
+        self.local = threading.local()
+
+    def encode(self, doc):
+        item = encode_json(doc)
+        return item, len(item) + 1
+
+    def bulk_docs(self, items):
+        # One reusable request buffer per sending thread.
+        buf = getattr(self.local, "buffer", None)
+        if buf is None:
+            buf = self.local.buffer = StringIO()
+        buf.seek(0)
+        buf.truncate()
+        buf.write('{"docs":[')
+        buf.write(",".join(items))
+        buf.write("]}")
+
+        body = self.post("/_bulk_docs", buf.getvalue(),
+                         (httplib.CREATED, httplib.ACCEPTED))
+
+        # Successful rows carry no "error" key, so most responses need no parsing.
+        if '"error"' not in body:
+            return []
+        return [(index, result["error"], result.get("reason"))
+                for index, result in enumerate(json.loads(body))
+                if "error" in result]
+
+    def fetch(self, ids):
+        body = self.post("/_all_docs?include_docs=true", encode_json({"keys": ids}))
+        return dict((row["id"], row["doc"]) for row in json.loads(body)["rows"]
+                    if row.get("doc") is not None)
+
+    def revisions(self, ids):
+        body = self.post("/_all_docs", encode_json({"keys": ids}))
+        return dict((row["id"], row["value"]["rev"])
+                    for row in json.loads(body)["rows"]
+                    if row.get("value") is not None)
+
+    def post(self, path, body, expected=(httplib.OK,)):
+        status, response = self.pool.post(self.path + path, body, self.headers)
+        if status not in expected:
+            raise BulkDocsError("%s returned %d: %s" % (path, status, response[:200]),
+                                status)
+        return response
+
+class ConnectionPool:
+    def __init__(self, scheme, host, port, size):
+        if scheme == "https":
+            self.connection_class = httplib.HTTPSConnection
+        else:
+            self.connection_class = httplib.HTTPConnection
+        self.host = host
+        self.port = port
+        self.idle = Queue.Queue()
+        for i in range(size):
+            self.idle.put(None)
+
+    def post(self, path, body, headers):
+        conn = self.idle.get()
+        try:
+            if conn is not None:
+                try:
+                    return self.request(conn, path, body, headers)
+                except (httplib.HTTPException, socket.error):
+                    conn.close() # server dropped an idle keep-alive connection
+            conn = self.connection_class(self.host, self.port)
+            return self.request(conn, path, body, headers)
+        except:
+            conn.close()
+            conn = None
+            raise
+        finally:
+            self.idle.put(conn)
+
+    def request(self, conn, path, body, headers):
+        conn.request("POST", path, body, headers)
+        response = conn.getresponse()
+        return response.status, response.read()
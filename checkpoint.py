@@ -0,0 +1,36 @@
+import os
+import json
+
+class Checkpoint:
+    def __init__(self, filename):
+        self.filename = filename
+        self.state = {}
+
+        if os.path.exists(filename):
+            for line in open(filename):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue # torn final write from a crash
+                self.state[entry["task"]] = entry
+
+        self.out = open(filename, "a")
+
+    def is_complete(self, task):
+        return self.state.get(task, {}).get("complete", False)
+
+    def last_key(self, task):
+        return self.state.get(task, {}).get("last_key")
+
+    def commit(self, task, last_key):
+        self.record({"task": task, "last_key": last_key, "complete": False})
+
+    def complete(self, task):
+        self.record({"task": task, "last_key": self.last_key(task),
+                     "complete": True})
+
+    def record(self, entry):
+        self.state[entry["task"]] = entry
+        self.out.write(json.dumps(entry) + "\n")
+        self.out.flush()
+        os.fsync(self.out.fileno())
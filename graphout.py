@@ -0,0 +1,125 @@
+from collections import Counter
+from xml.sax.saxutils import quoteattr
+
+from loadorder import strongly_connected_components
+
+# Output for table graphs too large to draw as one flat digraph: parallel
+# edges collapsed with counts, tables clustered by connected or strongly
+# connected component, a depth-limited neighborhood of one table, and
+# GraphML written a line at a time.
+
+CLUSTERINGS = ("cc", "scc")
+GRAPH_OPTIONS = 'cg:n:d:x'
+
+def neighborhood(edges, center, depth):
+    adjacent = {}
+    for a, b in edges:
+        adjacent.setdefault(a, set()).add(b)
+        adjacent.setdefault(b, set()).add(a)
+    seen = set([center])
+    frontier = seen
+    for i in range(depth):
+        frontier = set(n for f in frontier for n in adjacent.get(f, ())) - seen
+        seen.update(frontier)
+    return seen
+
+def restrict(nodes, edges, keep):
+    return ([n for n in nodes if n in keep],
+            [(a, b) for a, b in edges if a in keep and b in keep])
+
+def components(nodes, edges, clustering):
+    if clustering == "scc":
+        deps = dict((n, []) for n in nodes)
+        for a, b in edges:
+            deps[a].append((b, None))
+        return strongly_connected_components(deps)
+
+    parent = dict((n, n) for n in nodes)
+    def find(n):
+        while parent[n] != n:
+            parent[n] = parent[parent[n]]
+            n = parent[n]
+        return n
+    for a, b in edges:
+        parent[find(a)] = find(b)
+    groups = {}
+    for n in nodes:
+        groups.setdefault(find(n), []).append(n)
+    return sorted(sorted(g) for g in groups.values())
+
+def graph_nodes(nodes, edges):
+    # Nodes in first-seen order, including edge ends not listed as nodes.
+    seen = set()
+    out = []
+    for n in list(nodes) + [n for edge in edges for n in edge]:
+        if n not in seen:
+            seen.add(n)
+            out.append(n)
+    return out
+
+def dot_lines(nodes, edges, name="G", indent="  ", collapse=False,
+              clustering=None):
+    yield "digraph %s {" % name
+    if clustering is not None:
+        for i, group in enumerate(components(graph_nodes(nodes, edges), edges,
+                                             clustering)):
+            if len(group) < 2: continue
+            yield "%ssubgraph cluster_%d {" % (indent, i)
+            yield '%s%slabel="%s %d: %d tables";' % (indent, indent, clustering,
+                                                     i, len(group))
+            for n in group:
+                yield "%s%s%s;" % (indent, indent, n)
+            yield "%s}" % indent
+
+    if collapse:
+        for (a, b), count in sorted(Counter(edges).items()):
+            label = ' [label="%d", penwidth=%d]' % (count, min(count, 8)) \
+                if count > 1 else ""
+            yield "%s%s -> %s%s;" % (indent, a, b, label)
+    else:
+        for a, b in edges:
+            yield "%s%s -> %s;" % (indent, a, b)
+    yield "}"
+
+def graphml_lines(nodes, edges, collapse=False, clustering=None):
+    yield '<?xml version="1.0" encoding="UTF-8"?>'
+    yield '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">'
+    yield '  <key id="count" for="edge" attr.name="count" attr.type="int"/>'
+    yield '  <key id="component" for="node" attr.name="component" attr.type="int"/>'
+    yield '  <graph id="G" edgedefault="directed">'
+
+    nodes = graph_nodes(nodes, edges)
+    if clustering is not None:
+        component = {}
+        for i, group in enumerate(components(nodes, edges, clustering)):
+            for n in group:
+                component[n] = i
+    for n in nodes:
+        if clustering is None:
+            yield '    <node id=%s/>' % quoteattr(n)
+        else:
+            yield '    <node id=%s><data key="component">%d</data></node>' % (
+                quoteattr(n), component[n])
+
+    if collapse:
+        edges = sorted(Counter(edges).items())
+    else:
+        edges = [(edge, 1) for edge in edges]
+    for (a, b), count in edges:
+        yield '    <edge source=%s target=%s><data key="count">%d</data></edge>' % (
+            quoteattr(a), quoteattr(b), count)
+    yield '  </graph>'
+    yield '</graphml>'
+
+def graph_lines(nodes, edges, options, name="G", indent="  "):
+    # Shared command line handling: -c collapse, -g cc|scc, -n table with
+    # -d depth, -x GraphML.
+    if "-n" in options:
+        nodes, edges = restrict(nodes, edges, neighborhood(
+                edges, options["-n"], int(options.get("-d", 1))))
+    clustering = options.get("-g")
+    if clustering is not None and clustering not in CLUSTERINGS:
+        raise ValueError("unknown clustering: %s" % clustering)
+    if "-x" in options:
+        return graphml_lines(nodes, edges, "-c" in options, clustering)
+    return dot_lines(nodes, edges, name, indent, "-c" in options, clustering)
@@ -0,0 +1,135 @@
+import mmap
+import time
+
+import importmysql
+from importmysql import RowConverter, table_writer, connect_couch
+from metrics import TableMetrics, RunMetrics
+from parse_inserts import index_dump, statements, column_converter
+
+# Loads the data of a mysqldump file straight into CouchDB, through the
+# same row converters and bulk writers as importmysql, without restoring
+# it into MySQL first.
+
+def map_dump(filename):
+    with open(filename, "rb") as dump:
+        return mmap.mmap(dump.fileno(), 0, access=mmap.ACCESS_READ)
+
+def section_bytes(spans):
+    return sum(end - start for start, end in spans)
+
+def convert_dump(data, couch, schema, workers=1, dumpfile=None, couch_args=None):
+    columns, sections = index_dump(data)
+    run = RunMetrics()
+    tasks = []
+    for name in sorted(sections, key=lambda n: section_bytes(sections[n]), reverse=True):
+        table = schema.tables.get(name)
+        if table is None or not table.include:
+            print "skipping table: %s" % name
+            continue
+        if name not in columns:
+            print "skipping table: %s: no CREATE TABLE in dump" % name
+            continue
+        tasks.append((name, columns[name], sections[name]))
+
+    if workers > 1:
+        from multiprocessing import Pool
+        pool = Pool(workers, init_worker, (dumpfile, couch_args, schema))
+        try:
+            for metrics in pool.imap_unordered(load_section_worker, tasks):
+                run.add(metrics)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+    else:
+        for name, order, spans in tasks:
+            run.add(load_section(data, schema.tables[name], order, spans, couch))
+    return run.finish()
+
+_worker = {}
+
+def init_worker(dumpfile, couch_args, schema):
+    _worker['data'] = map_dump(dumpfile)
+    _worker['couch'] = connect_couch(**couch_args)
+    _worker['schema'] = schema
+
+def load_section_worker(task):
+    name, order, spans = task
+    return load_section(_worker['data'], _worker['schema'].tables[name], order,
+                        spans, _worker['couch'])
+
+def row_projection(table, columns):
+    # Positions and converters of the included columns of a statement.
+    positions, converters, names = [], [], []
+    for i, name in enumerate(columns):
+        column = table.columns.get(name)
+        if column is None: continue
+        if not column.include and name != table.primary_key: continue
+        positions.append(i)
+        converters.append(column_converter(column.mysql_type))
+        names.append(name)
+    return positions, converters, [(name,) for name in names]
+
+def load_section(data, table, order, spans, couch):
+    print "loading table: %s from dump" % table.name
+    metrics = TableMetrics(table.name)
+    converter = RowConverter(table)
+    writer = table_writer(couch, table, table.name, None)
+    projections = {}
+    try:
+        start = time.time()
+        for columns, rows in statements(data, spans, order):
+            metrics.fetch_time += time.time() - start
+
+            start = time.time()
+            key = tuple(columns)
+            if key not in projections:
+                positions, converters, description = row_projection(table, columns)
+                projections[key] = (positions, converters,
+                                    converter.bind(description))
+            positions, converters, row2doc = projections[key]
+            docs = [row2doc([None if row[i] is None else convert(row[i])
+                             for i, convert in zip(positions, converters)])
+                    for row in rows]
+            metrics.convert_time += time.time() - start
+
+            writer.add(docs)
+            metrics.add_rows(len(docs))
+            start = time.time()
+    except:
+        writer.abort()
+        raise
+    writer.close()
+    if hasattr(writer.sink, "close"):
+        writer.sink.close()
+    print "uploaded table: %s: %s" % (table.name, writer.stats)
+    return metrics.finish(writer.stats, section_bytes(spans))
+
+if __name__ == "__main__":
+    import getopt
+    import sys
+    from jsonschema import load_json_schema
+
+    optlist, args = getopt.getopt(sys.argv[1:], 'j:b:S:fm:w:oz:')
+    options = dict(optlist)
+    workers = int(options.get("-j", 1))
+    if "-w" in options:
+        importmysql.WRITE_CONCURRENCY = int(options["-w"])
+    if "-b" in options:
+        importmysql.BATCH_BYTES = int(options["-b"])
+    dumpfile = args[0]
+    couchdbname = args[1]
+    schemafile = args[2]
+
+    schema = load_json_schema(schemafile)
+    couch_args = dict(couchdbname=couchdbname, server_url=options.get("-S"),
+                      fast="-f" in options, dump="-o" in options,
+                      compression=options.get("-z"))
+
+    run = convert_dump(map_dump(dumpfile), connect_couch(**couch_args), schema,
+                       workers, dumpfile, couch_args)
+    print "finished: %s" % run.progress()
+    if "-m" in options:
+        run.write_report(options["-m"])
@@ -1,11 +1,37 @@
+import time
+
 import couchdb
 import MySQLdb
+import MySQLdb.cursors
 from MySQLdb.constants import FIELD_TYPE
 from  MySQLdb.converters import conversions as default_conv
 
+from bulk import BulkWriter, ConcurrentWriter, BatchBudget, HttpSink, \
+    INITIAL_BATCH_BYTES
+from checkpoint import Checkpoint
+from loadorder import plan_loads
+from ndjsondump import FileSink
+from metrics import TableMetrics, RunMetrics
+from pipeline import Pipeline
+
 BATCH_SIZE = 1000
+BATCH_BYTES = INITIAL_BATCH_BYTES
+WRITE_CONCURRENCY = 1
+PIPELINE_DEPTH = 4
+DEFERRED_BATCH_SIZE = 100
+LARGE_COLUMN_POLICIES = ("keep", "skip", "truncate", "defer")
+LARGE_COLUMN_POLICY = "keep"
+TRUNCATE_LENGTH = 1024
+LARGE_COLUMN_TYPES = ("tinyblob", "blob", "mediumblob", "longblob",
+                      "tinytext", "text", "mediumtext", "longtext")
 RESERVED_COLUMN_NAMES = ("_id", "_rev", "type")
 
+# Per-table import state by table name: the compiled row converters and,
+# for embedding, each parent's child tables and each child's relationship.
+_converters = {}
+_embeds = {}
+_embedded_in = {}
+
 FIELD_CONVERSIONS = MySQLdb.converters.conversions.copy()
 FIELD_CONVERSIONS.update({
         FIELD_TYPE.BIT: lambda s: s == '\x01',
@@ -16,63 +42,613 @@ FIELD_CONVERSIONS.update({
         FIELD_TYPE.NEWDECIMAL: lambda s: s,
 })
 
-def convert(mysql, couch, schema):
-    cursor = mysql.cursor(MySQLdb.cursors.DictCursor)
+def connect_mysql(**kwargs):
+    return MySQLdb.connect(charset="utf8", use_unicode=True,
+                           conv=FIELD_CONVERSIONS, **kwargs)
 
-    for table in schema.tables.values():
-        load_table(cursor, table, couch)
+def table_loader(mysql, streaming):
+    if streaming:
+        return mysql.cursor(MySQLdb.cursors.SSCursor), load_table_streaming
+    return mysql.cursor(MySQLdb.cursors.Cursor), load_table
+
+def connect_couch(couchdbname, server_url=None, fast=False, dump=False,
+                  compression=None):
+    if dump:
+        # Dump files are only appended to, so there are no documents to
+        # read back and merge deferred columns into.
+        if LARGE_COLUMN_POLICY == "defer":
+            raise ValueError("deferred large columns need a CouchDB target")
+        return FileSink(couchdbname, compression)
+    url = server_url or couchdb.client.DEFAULT_BASE_URL
+    if fast:
+        return HttpSink(url.rstrip("/") + "/" + couchdbname, WRITE_CONCURRENCY)
+    return couchdb.Server(url)[couchdbname]
+
+def convert(mysql, couch, schema, streaming=False, checkpoint=None, embed=(),
+            chunk_size=None):
+    plan_embedding(schema, embed)
+    compile_converters(schema)
+    expected = table_rows(mysql)
+    run = RunMetrics(expected_total(schema, expected))
+    cursor, load = table_loader(mysql, streaming)
+
+    for name in load_plan(schema).order():
+        table = schema.tables[name]
+        if chunk_size is None or not table.include:
+            ranges = [None]
+        else:
+            ranges = key_ranges(mysql, table, chunk_size)
+
+        # Chunks are read one after another, each its own query and
+        # checkpoint task, the same as the tasks convert_parallel hands out.
+        merged = None
+        for key_range in ranges:
+            metrics = table_load(table, load)(
+                cursor, table, couch, key_range, checkpoint,
+                expected.get(table.name) if key_range is None else None)
+            if metrics is None: continue
+            if merged is None:
+                merged = metrics
+            else:
+                merged.merge(metrics)
+        if merged is not None:
+            merged.name = table.name
+            merged.expected_rows = expected.get(table.name)
+            run.add(merged)
+    return run.finish()
+
+def convert_parallel(mysql_args, couch_args, schema, workers,
+                     streaming=False, chunk_size=None, checkpoint_file=None,
+                     connect=connect_mysql, embed=(), ordered=False):
+    from multiprocessing import Pool
+
+    plan_embedding(schema, embed)
+    mysql = connect(**mysql_args)
+    sizes = table_sizes(mysql)
+    expected = table_rows(mysql)
+    run = RunMetrics(expected_total(schema, expected))
+
+    # Ordered loads run the ready sets one after another; within a set,
+    # or for the whole schema otherwise, the largest tables go first.
+    if ordered:
+        waves = load_plan(schema).levels
+    else:
+        waves = [schema.tables.keys()]
+    waves = [[schema.tables[name] for name in
+              sorted(wave, key=lambda n: sizes.get(n, 0), reverse=True)]
+             for wave in waves]
+
+    tasks = []
+    for wave in waves:
+        wave_tasks = []
+        for table in wave:
+            if chunk_size is None or not table.include:
+                wave_tasks.append((table.name, None))
+            else:
+                wave_tasks.extend((table.name, key_range)
+                                  for key_range in key_ranges(mysql, table, chunk_size))
+        tasks.append(wave_tasks)
+    mysql.close()
+
+    remaining = {}
+    for wave_tasks in tasks:
+        for name, key_range in wave_tasks:
+            remaining[name] = remaining.get(name, 0) + 1
+
+    pool = Pool(workers, init_worker,
+                (mysql_args, couch_args, schema, streaming, checkpoint_file,
+                 connect, embed))
+    try:
+        merged = {}
+        for wave_tasks in tasks:
+            for name, metrics in pool.imap_unordered(load_table_worker, wave_tasks):
+                remaining[name] -= 1
+                if metrics is not None:
+                    if name in merged:
+                        merged[name].merge(metrics)
+                    else:
+                        merged[name] = metrics
+                if remaining[name] == 0 and name in merged:
+                    merged[name].name = name
+                    merged[name].expected_rows = expected.get(name)
+                    run.add(merged[name])
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return run.finish()
+
+def load_plan(schema):
+    plan = plan_loads(schema)
+    for name, rel in plan.broken:
+        print "loading %s before %s: reference %s.%s broken" % (
+            name, rel.table, name, ",".join(rel.local_columns))
+    return plan
+
+def key_ranges(mysql, table, chunk_size):
+    # Seeking through the keys is only cheap on an indexed column.
+    pk = table.primary_key
+    if pk is None or not table.leading_indexes(pk):
+        return [None]
+
+    cursor = mysql.cursor()
+    cursor.execute("SELECT MIN(%s), MAX(%s) FROM %s" % (pk, pk, table.name))
+    lo, hi = cursor.fetchone()
+    if not isinstance(lo, (int, long)):
+        return [None]
+
+    # Seek chunk_size keys ahead on the primary key index rather than
+    # stepping the raw key space, so gaps do not produce empty chunks.
+    ranges = []
+    while True:
+        cursor.execute("SELECT %s FROM %s WHERE %s >= %%s ORDER BY %s "
+                       "LIMIT 1 OFFSET %d" % (pk, table.name, pk, pk, chunk_size),
+                       (lo,))
+        row = cursor.fetchone()
+        if row is None:
+            ranges.append((lo, hi))
+            return ranges
+        ranges.append((lo, row[0] - 1))
+        lo = row[0]
+
+def table_rows(mysql):
+    cursor = mysql.cursor()
+    cursor.execute("SELECT table_name, table_rows FROM information_schema.tables "
+                   "WHERE table_schema = DATABASE()")
+    return dict((name, rows or 0) for name, rows in cursor.fetchall())
+
+def expected_total(schema, expected):
+    return sum(expected.get(t.name, 0) for t in schema.tables.values() if t.include)
+
+def session_bytes_sent(cursor):
+    cursor.execute("SHOW SESSION STATUS LIKE 'Bytes_sent'")
+    return int(cursor.fetchone()[1])
+
+def table_sizes(mysql):
+    cursor = mysql.cursor()
+    cursor.execute("SELECT table_name, data_length FROM information_schema.tables "
+                   "WHERE table_schema = DATABASE()")
+    return dict((name, size or 0) for name, size in cursor.fetchall())
+
+_worker = {}
+
+def init_worker(mysql_args, couch_args, schema, streaming, checkpoint_file,
+                connect, embed):
+    mysql = connect(**mysql_args)
+    _worker['cursor'], _worker['load'] = table_loader(mysql, streaming)
+    _worker['couch'] = connect_couch(**couch_args)
+    _worker['schema'] = schema
+    plan_embedding(schema, embed)
+    compile_converters(schema)
+    _worker['checkpoint'] = checkpoint_file and Checkpoint(checkpoint_file)
+
+def load_table_worker(task):
+    table_name, key_range = task
+    table = _worker['schema'].tables[table_name]
+    load = table_load(table, _worker['load'])
+    return table_name, load(_worker['cursor'], table, _worker['couch'],
+                            key_range, _worker['checkpoint'])
+
+def table_label(table, key_range=None):
+    if key_range is None:
+        return table.name
+    return "%s (%s %s..%s)" % ((table.name, table.primary_key) + key_range)
+
+def is_large(column):
+    return column.mysql_type.lower() in LARGE_COLUMN_TYPES
+
+def select_columns(table):
+    deferred = deferred_columns(table)
+    exprs = []
+    for col in table.columns.values():
+        if col.name == table.primary_key:
+            exprs.append("`%s`" % col.name)
+        elif not col.include or col in deferred:
+            continue
+        elif is_large(col) and LARGE_COLUMN_POLICY == "skip":
+            continue
+        elif is_large(col) and LARGE_COLUMN_POLICY == "truncate":
+            exprs.append("LEFT(`%s`, %d) AS `%s`" % (col.name, TRUNCATE_LENGTH, col.name))
+        else:
+            exprs.append("`%s`" % col.name)
+    return exprs
+
+def deferred_columns(table):
+    if LARGE_COLUMN_POLICY != "defer" or table.primary_key is None:
+        return []
+    return [col for col in table.columns.values()
+            if col.include and is_large(col) and col.name != table.primary_key]
+
+def where_clause(table, key_range=None, after=None, extra=()):
+    pk = table.primary_key
+    clauses, args = list(extra), []
+    if key_range is not None:
+        clauses.append("%s BETWEEN %%s AND %%s" % pk)
+        args.extend(key_range)
+    if after is not None:
+        clauses.append("%s > %%s" % pk)
+        args.append(after)
+
+    if not clauses:
+        return "", None
+    return " WHERE " + " AND ".join(clauses), args
 
-def load_table(cursor, table, couch):
+def select_query(table, key_range=None, after=None, ordered=False):
+    where, args = where_clause(table, key_range, after, orphan_filter(table))
+    query = "SELECT %s FROM %s%s" % (", ".join(select_columns(table)),
+                                     table.name, where)
+    if ordered and table.primary_key is not None:
+        query += " ORDER BY %s" % table.primary_key
+    return query, args
+
+def start_table(cursor, table, key_range, checkpoint):
+    task = table_label(table, key_range)
+    after = None
+    if checkpoint is not None:
+        if checkpoint.is_complete(task):
+            return None
+        after = checkpoint.last_key(task)
+        if after is not None:
+            print "resuming table: %s after %s" % (task, after)
+
+    cursor.execute(*select_query(table, key_range, after,
+                                 ordered=checkpoint is not None))
+    return task
+
+def table_writer(couch, table, task, checkpoint):
+    if checkpoint is None or table.primary_key is None:
+        commit = None
+    else:
+        commit = lambda last_doc: checkpoint.commit(task, last_doc[table.primary_key])
+    if hasattr(couch, "for_table"):
+        couch = couch.for_table(task)
+    if WRITE_CONCURRENCY > 1:
+        return ConcurrentWriter(couch, WRITE_CONCURRENCY,
+                                BatchBudget(BATCH_BYTES), commit)
+    return BulkWriter(couch, BatchBudget(BATCH_BYTES), commit)
+
+def finish_table(cursor, table, key_range, writer, task, checkpoint,
+                 metrics, read_start):
+    writer.close()
+    if hasattr(writer.sink, "close"):
+        writer.sink.close()
+    if deferred_columns(table):
+        load_deferred(cursor, table, key_range, writer.sink)
+    if checkpoint is not None:
+        checkpoint.complete(task)
+    print "uploaded table: %s: %s" % (task, writer.stats)
+    return metrics.finish(writer.stats, session_bytes_sent(cursor) - read_start)
+
+def load_table(cursor, table, couch, key_range=None, checkpoint=None,
+               expected_rows=None):
     if not table.include:
         print "skipping table: %s" % table.name
-        return
+        return None
+
+    print "loading table: %s" % table_label(table, key_range)
+    metrics = TableMetrics(table_label(table, key_range), expected_rows)
+    read_start = session_bytes_sent(cursor)
+    task = start_table(cursor, table, key_range, checkpoint)
+    if task is None:
+        print "already loaded: %s" % table_label(table, key_range)
+        return metrics.finish()
+
+    row2doc = _converters[table.name].bind(cursor.description)
+    writer = table_writer(couch, table, task, checkpoint)
+    try:
+        while True:
+            start = time.time()
+            rows = cursor.fetchmany(BATCH_SIZE)
+            metrics.fetch_time += time.time() - start
+            if len(rows) < 1: break
+
+            start = time.time()
+            docs = map(row2doc, rows)
+            metrics.convert_time += time.time() - start
+            writer.add(docs)
+            metrics.add_rows(len(docs))
+    except:
+        writer.abort()
+        raise
+
+    return finish_table(cursor, table, key_range, writer, task, checkpoint,
+                        metrics, read_start)
+
+def load_table_streaming(cursor, table, couch, key_range=None, checkpoint=None,
+                         expected_rows=None):
+    if not table.include:
+        print "skipping table: %s" % table.name
+        return None
+
+    print "streaming table: %s" % table_label(table, key_range)
+    metrics = TableMetrics(table_label(table, key_range), expected_rows)
+    read_start = session_bytes_sent(cursor)
+    task = start_table(cursor, table, key_range, checkpoint)
+    if task is None:
+        print "already loaded: %s" % table_label(table, key_range)
+        return metrics.finish()
+
+    row2doc = _converters[table.name].bind(cursor.description)
+    pipeline = Pipeline(PIPELINE_DEPTH)
+    fetched = pipeline.queue()
+    converted = pipeline.queue()
+    writer = table_writer(couch, table, task, checkpoint)
+
+    def fetch():
+        while not pipeline.stopped.is_set():
+            start = time.time()
+            rows = cursor.fetchmany(BATCH_SIZE)
+            metrics.fetch_time += time.time() - start
+            if len(rows) < 1: break
+            pipeline.put(fetched, rows)
+        pipeline.put(fetched, None)
+
+    def send():
+        while True:
+            docs = pipeline.get(converted)
+            if docs is None: break
+            writer.add(docs)
+        writer.flush()
+
+    pipeline.start(fetch)
+    pipeline.start(send)
+    try:
+        while True:
+            rows = pipeline.get(fetched)
+            if rows is None: break
 
-    print "loading table: %s" % table.name
-    cursor.execute("SELECT * FROM %s" % table.name)
+            start = time.time()
+            docs = map(row2doc, rows)
+            metrics.convert_time += time.time() - start
+            pipeline.put(converted, docs)
+            metrics.add_rows(len(docs))
+        pipeline.put(converted, None)
+        pipeline.join()
+    except:
+        writer.abort()
+        pipeline.abort()
+        raise
+    return finish_table(cursor, table, key_range, writer, task, checkpoint,
+                        metrics, read_start)
 
-    n_processed = 0
+def plan_embedding(schema, specs):
+    # Each spec names a child table and its foreign key column, e.g.
+    # "address.AgentID": the child rows are stored inside the documents of
+    # the table the key refers to instead of as documents of their own.
+    _embeds.clear()
+    _embedded_in.clear()
+
+    for spec in specs:
+        child_name, _, column = spec.partition(".")
+        child = schema.tables.get(child_name)
+        if child is None or column not in child.relationships:
+            raise ValueError("no relationship %s to embed" % spec)
+        rel = child.relationships[column]
+        parent = schema.tables[rel.table]
+        if rel.remote_column != parent.primary_key or child.primary_key is None:
+            raise ValueError("can only embed %s by a key into %s.%s" % (
+                    spec, parent.name, parent.primary_key))
+        if not (child.include and parent.include):
+            raise ValueError("can not embed %s: table not included" % spec)
+        if child.name in parent.columns:
+            raise ValueError("can not embed %s: %s already has a column %s" % (
+                    spec, parent.name, child.name))
+        if deferred_columns(child):
+            raise ValueError("can not embed %s with deferred columns" % spec)
+        if "`%s`" % rel.local_column not in select_columns(child):
+            # The merge in embed_children reads the key from each child row.
+            raise ValueError("can not embed %s: column %s is not selected" % (
+                    spec, spec))
+        _embedded_in[child.name] = rel
+        _embeds.setdefault(parent.name, []).append(child)
+
+    for name, rel in _embedded_in.items():
+        if name in _embeds or rel.table == name:
+            raise ValueError("can not embed %s: nested embedding" % name)
+
+def orphan_filter(table):
+    # Rows of an embedded table whose key matches no parent row are still
+    # loaded as documents of their own.
+    rel = _embedded_in.get(table.name)
+    if rel is None:
+        return []
+    return ["NOT EXISTS (SELECT 1 FROM %s WHERE %s.%s = %s.%s)" % (
+            rel.table, rel.table, rel.remote_column, table.name, rel.local_column)]
+
+def table_load(table, load):
+    if table.name in _embeds:
+        return load_table_embedded
+    return load
+
+def load_table_embedded(cursor, table, couch, key_range=None, checkpoint=None,
+                        expected_rows=None):
+    # Parents are read a page at a time in key order; the children of each
+    # page are read sorted by foreign key and merged in, so neither table
+    # is ever held in memory as a whole.
+    print "loading table: %s with %s" % (table_label(table, key_range),
+                                          ", ".join(c.name for c in
+                                                    _embeds[table.name]))
+    metrics = TableMetrics(table_label(table, key_range), expected_rows)
+    read_start = session_bytes_sent(cursor)
+    task = table_label(table, key_range)
+    after = None
+    if checkpoint is not None:
+        if checkpoint.is_complete(task):
+            print "already loaded: %s" % task
+            return metrics.finish()
+        after = checkpoint.last_key(task)
+        if after is not None:
+            print "resuming table: %s after %s" % (task, after)
+
+    writer = table_writer(couch, table, task, checkpoint)
+    try:
+        while True:
+            start = time.time()
+            query, args = select_query(table, key_range, after, ordered=True)
+            cursor.execute(query + " LIMIT %d" % BATCH_SIZE, args)
+            rows = cursor.fetchall()
+            metrics.fetch_time += time.time() - start
+            if len(rows) < 1: break
+
+            start = time.time()
+            docs = map(_converters[table.name].bind(cursor.description), rows)
+            metrics.convert_time += time.time() - start
+            lo, hi = docs[0][table.primary_key], docs[-1][table.primary_key]
+            embedded = sum(embed_children(cursor, table, child, docs, lo, hi, metrics)
+                           for child in _embeds[table.name])
+            writer.add(docs)
+            metrics.add_rows(len(docs) + embedded)
+            after = hi
+    except:
+        writer.abort()
+        raise
+    return finish_table(cursor, table, key_range, writer, task, checkpoint,
+                        metrics, read_start)
+
+def embed_children(cursor, table, child, docs, lo, hi, metrics):
+    rel = _embedded_in[child.name]
+    fk = rel.local_column
+    start = time.time()
+    cursor.execute("SELECT %s FROM %s WHERE %s BETWEEN %%s AND %%s ORDER BY %s, %s" % (
+            ", ".join(select_columns(child)), child.name, fk, fk, child.primary_key),
+                   (lo, hi))
+    rows = cursor.fetchall()
+    metrics.fetch_time += time.time() - start
+
+    start = time.time()
+    row2doc = _converters[child.name].bind(cursor.description)
+    position = [d[0] for d in cursor.description].index(fk)
+    pk = table.primary_key
+    i = matched = 0
+    for doc in docs:
+        doc[child.name] = children = []
+        while i < len(rows) and rows[i][position] < doc[pk]:
+            i += 1
+        while i < len(rows) and rows[i][position] == doc[pk]:
+            embedded = row2doc(rows[i])
+            del embedded["_id"]
+            children.append(embedded)
+            i += 1
+        matched += len(children)
+    metrics.convert_time += time.time() - start
+    return matched
+
+def load_deferred(cursor, table, key_range, sink):
+    # Second pass: merge deferred large values into the documents stored
+    # by the first pass, a few rows at a time.
+    columns = deferred_columns(table)
+    names = ", ".join("`%s`" % col.name for col in columns)
+    not_null = " OR ".join("`%s` IS NOT NULL" % col.name for col in columns)
+    where, args = where_clause(table, key_range, extra=["(%s)" % not_null])
+
+    print "loading deferred columns: %s: %s" % (table_label(table, key_range), names)
+    cursor.execute("SELECT %s, %s FROM %s%s" % (table.primary_key, names,
+                                               table.name, where), args)
+
+    writer = BulkWriter(sink, BatchBudget(BATCH_BYTES))
     while True:
-        rows = cursor.fetchmany(BATCH_SIZE)
+        rows = cursor.fetchmany(DEFERRED_BATCH_SIZE)
         if len(rows) < 1: break
-        docs = [row2doc(row, table) for row in rows]
-        couch.update(docs)
-        n_processed += len(docs)
+        docs = sink.fetch([doc_id(table, row[0]) for row in rows])
+        for row in rows:
+            doc = docs[doc_id(table, row[0])]
+            for col, value in zip(columns, row[1:]):
+                if value is not None:
+                    doc[col.name] = value
+        writer.add(docs.values())
+    writer.close()
 
-def row2doc(row, table):
-    doc = couchdb.Document()
-    doc['type'] = table.name
+def compile_converters(schema):
+    _converters.clear()
+    for table in schema.tables.values():
+        if table.include:
+            _converters[table.name] = RowConverter(table)
 
-    for col in table.columns.values():
-        load_value(doc, col, row)
+class RowConverter:
+    def __init__(self, table):
+        for name in table.columns:
+            if name in RESERVED_COLUMN_NAMES:
+                raise ValueError("reserved column name %s in table %s" %
+                                 (name, table.name))
+        self.table = table
+
+    def bind(self, description):
+        # Generate a straight-line function for this table and the columns
+        # of the current result set, so per-row work is just the dict.
+        positions = dict((d[0], i) for i, d in enumerate(description))
+        table = self.table
+
+        body = ["def row2doc(row):",
+                "    doc = {'type': %r}" % table.name]
+        if table.primary_key is not None:
+            body.append("    doc['_id'] = %r %% (row[%d],)" % (
+                doc_id(table, "%s"), positions[table.primary_key]))
+        for name, position in sorted(positions.items(), key=lambda p: p[1]):
+            body.append("    value = row[%d]" % position)
+            body.append("    if value is not None: doc[%r] = value" % name)
+        body.append("    return doc")
 
-    return doc
+        namespace = {}
+        exec "\n".join(body) in namespace
+        return namespace["row2doc"]
 
-def load_value(doc, col, row):
-    if col.name in RESERVED_COLUMN_NAMES: raise ValueError()
-    value = row[col.name]
-    if value is not None:
-        doc[col.name] = value
+def doc_id(table, key):
+    return "%s.%s" % (table.name, key)
 
 if __name__ == "__main__":
     import getopt
     import sys
-    import json
-    from jsonschema import json2schema
+    from jsonschema import load_json_schema
 
-    optlist, args = getopt.getopt(sys.argv[1:], 'u:p:')
+    optlist, args = getopt.getopt(sys.argv[1:], 'u:p:j:sc:k:b:S:fl:m:w:oz:e:O')
     options  = dict(optlist)
+    embed = [value for option, value in optlist if option == "-e"]
     username = options["-u"]
     password = options["-p"]
+    workers = int(options.get("-j", 1))
+    streaming = "-s" in options
+    chunk_size = int(options["-c"]) if "-c" in options else None
+    checkpoint_file = options.get("-k")
+    if "-w" in options:
+        WRITE_CONCURRENCY = int(options["-w"])
+    if "-b" in options:
+        BATCH_BYTES = int(options["-b"])
+    if "-l" in options:
+        LARGE_COLUMN_POLICY, _, length = options["-l"].partition(":")
+        if LARGE_COLUMN_POLICY not in LARGE_COLUMN_POLICIES:
+            sys.exit("unknown large column policy: %s" % LARGE_COLUMN_POLICY)
+        if length:
+            TRUNCATE_LENGTH = int(length)
+    if "-o" in options and LARGE_COLUMN_POLICY == "defer":
+        sys.exit("deferred large columns need a CouchDB target")
     mysqldbname = args[0]
     couchdbname = args[1]
     schemafile = args[2]
 
-    schema = json2schema(json.load(open(schemafile)))
+    schema = load_json_schema(schemafile)
+    try:
+        plan_embedding(schema, embed)
+    except ValueError, e:
+        sys.exit(str(e))
 
-    mysql = MySQLdb.connect(user=username, passwd=password,
-                            db=mysqldbname, charset = "utf8",
-                            use_unicode = True, conv=FIELD_CONVERSIONS)
+    mysql_args = dict(user=username, passwd=password, db=mysqldbname)
+    couch_args = dict(couchdbname=couchdbname, server_url=options.get("-S"),
+                      fast="-f" in options, dump="-o" in options,
+                      compression=options.get("-z"))
 
-    couch = couchdb.Server()[couchdbname]
+    if workers > 1:
+        run = convert_parallel(mysql_args, couch_args, schema, workers,
+                               streaming, chunk_size, checkpoint_file,
+                               embed=embed, ordered="-O" in options)
+    else:
+        mysql = connect_mysql(**mysql_args)
+        couch = connect_couch(**couch_args)
+        checkpoint = checkpoint_file and Checkpoint(checkpoint_file)
+        run = convert(mysql, couch, schema, streaming, checkpoint, embed,
+                      chunk_size)
 
-    convert(mysql, couch, schema)
+    print "finished: %s" % run.progress()
+    if "-m" in options:
+        run.write_report(options["-m"])
@@ -0,0 +1,192 @@
+from collections import OrderedDict
+
+BATCH_KEYS = 500
+CACHE_SIZE = 10000
+
+missing = object()
+
+# Queries the view written by joins.compute_view. Referenced (parent) rows
+# are emitted as ["table.column" + value, 0] and the rows referring to them
+# as ["table.column" + value, 1], so both sides of a relationship are found
+# by key without knowing the other table's ids.
+
+class LRUCache:
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.items = OrderedDict()
+        self.hits = self.misses = 0
+
+    def get(self, key, default=None):
+        try:
+            value = self.items.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self.items[key] = value
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.items.pop(key, None)
+        self.items[key] = value
+        while len(self.items) > self.size:
+            self.items.popitem(last=False)
+
+def js_string(value):
+    # The view builds keys by JavaScript string concatenation.
+    if value is True: return "true"
+    if value is False: return "false"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return unicode(value)
+
+def join_key(rel, value, side):
+    return ["%s.%s%s" % (rel.table, rel.remote_column, js_string(value)), side]
+
+def sharded_views(docs):
+    # Maps each table to the view holding its emits, for design documents
+    # made by joins.sharded_design_docs.
+    views = {}
+    for doc in docs:
+        for table in doc["tables"]:
+            views[table] = doc["_id"][len("_design/"):] + "/joins"
+    return views
+
+def incoming(schema, table_name):
+    return [(t, r) for t, r in schema.incoming(table_name)
+            if t.include and r.local_column is not None]
+
+class Joiner:
+    def __init__(self, db, views=None, cache_size=CACHE_SIZE,
+                 batch_keys=BATCH_KEYS):
+        self.db = db
+        self.views = views or {}
+        self.cache = LRUCache(cache_size)
+        self.batch_keys = batch_keys
+
+    def view_for(self, table_name):
+        return self.views.get(table_name, "joins/joins")
+
+    def query(self, view, keys):
+        rows = []
+        for i in range(0, len(keys), self.batch_keys):
+            rows.extend(self.db.view(view, keys=keys[i:i + self.batch_keys],
+                                     include_docs=True, reduce=False))
+        return rows
+
+    def lookup(self, rel, values):
+        # Documents referenced through rel, keyed by foreign key value.
+        found, fetch = {}, []
+        for value in set(values):
+            doc = self.cache.get(tuple(join_key(rel, value, 0)), missing)
+            if doc is missing:
+                fetch.append(value)
+            else:
+                found[value] = doc
+
+        if fetch:
+            keys = [join_key(rel, value, 0) for value in fetch]
+            docs = dict((tuple(row.key), row.doc)
+                        for row in self.query(self.view_for(rel.table), keys))
+            for value, key in zip(fetch, keys):
+                doc = docs.get(tuple(key))
+                self.cache.put(tuple(key), doc)
+                found[value] = doc
+        return found
+
+    def referrers(self, table, rel, values):
+        # Documents of table referring through rel to each value. The view
+        # key names only the referenced column, so rows emitted for another
+        # foreign key of the same table to that column are told apart by
+        # the document's own rel column.
+        keys = [join_key(rel, value, 1) for value in set(values)]
+        by_key, seen = {}, set()
+        for row in self.query(self.view_for(table.name), keys):
+            doc = row.doc
+            if doc is None or doc.get("type") != table.name: continue
+            if join_key(rel, doc.get(rel.local_column), 1)[0] != row.key[0]: continue
+            if (row.key[0], doc["_id"]) in seen: continue
+            seen.add((row.key[0], doc["_id"]))
+            by_key.setdefault(row.key[0], []).append(doc)
+        return dict((value, by_key.get(join_key(rel, value, 1)[0], []))
+                    for value in set(values))
+
+    def join(self, docs, references=(), children=()):
+        # references are relationships of the documents' own table, each
+        # resolved to one referenced document and recorded by local column;
+        # children are (table, relationship) pairs resolved to the list of
+        # documents referring to this one, recorded as "table.column".
+        # Joined records are yielded a batch at a time.
+        batch = []
+        for doc in docs:
+            batch.append(doc)
+            if len(batch) >= self.batch_keys:
+                for record in self.join_batch(batch, references, children):
+                    yield record
+                batch = []
+        for record in self.join_batch(batch, references, children):
+            yield record
+
+    def join_batch(self, docs, references, children):
+        if not docs: return
+        joined = [{} for doc in docs]
+        for rel in references:
+            values = [doc[rel.local_column] for doc in docs
+                      if doc.get(rel.local_column) is not None]
+            found = self.lookup(rel, values)
+            for doc, record in zip(docs, joined):
+                record[rel.local_column] = found.get(doc.get(rel.local_column))
+        for table, rel in children:
+            values = [doc[rel.remote_column] for doc in docs
+                      if doc.get(rel.remote_column) is not None]
+            found = self.referrers(table, rel, values)
+            for doc, record in zip(docs, joined):
+                record["%s.%s" % (table.name, rel.local_column)] = \
+                    found.get(doc.get(rel.remote_column), [])
+        for doc, record in zip(docs, joined):
+            yield doc, record
+
+    def scan(self, table_name):
+        # All documents of a table, in id order, a batch at a time.
+        start = "%s." % table_name
+        while True:
+            rows = list(self.db.view("_all_docs", startkey=start,
+                                     endkey=u"%s.\ufff0" % table_name,
+                                     include_docs=True, limit=self.batch_keys + 1))
+            for row in rows[:self.batch_keys]:
+                yield row.doc
+            if len(rows) <= self.batch_keys: return
+            start = rows[-1].id
+
+if __name__ == '__main__':
+    import getopt
+    import json
+    import sys
+    import couchdb
+    from jsonschema import load_json_schema
+
+    optlist, args = getopt.getopt(sys.argv[1:], 'S:r:c:v:')
+    options = dict(optlist)
+    schema = load_json_schema(args[1])
+    table = schema.tables[args[2]]
+    server = couchdb.Server(options.get("-S") or couchdb.client.DEFAULT_BASE_URL)
+    views = sharded_views(json.load(open(options["-v"]))["docs"]) \
+        if "-v" in options else None
+    joiner = Joiner(server[args[0]], views)
+
+    if "-r" in options:
+        references = [table.relationships[c] for c in options["-r"].split(",") if c]
+    else:
+        references = [r for r in table.relationships.values()
+                      if r.local_column is not None]
+    if "-c" in options:
+        children = [(t, r) for t, r in incoming(schema, table.name)
+                    if "%s.%s" % (t.name, r.local_column) in options["-c"].split(",")]
+    else:
+        children = incoming(schema, table.name)
+
+    for doc, joined in joiner.join(joiner.scan(table.name), references, children):
+        doc.update(("joined:" + name, value) for name, value in joined.items())
+        print json.dumps(doc)
+    print >>sys.stderr, "cache: %d hits, %d misses" % (joiner.cache.hits,
+                                                        joiner.cache.misses)
@@ -1,31 +1,45 @@
+import json
+import threading
+import time
 
-def compute_view(schema):
-    for t in schema.tables.values():
-        t.lh_emits = set()
-        t.rh_emits = set()
+POLL_INTERVAL = 5.0
 
+def join_emits(schema):
+    # Per table: the foreign keys it emits as the referring side and the
+    # columns it emits as the referenced side.
+    emits = {}
     for t in schema.tables.values():
         if not t.include: continue
+        lh_emits = set()
         for r in t.relationships.values():
-            rtable = schema.tables[r.table]
-            if not rtable.include: continue
-            key = "%s.%s" % (r.table, r.remote_column)
-            t.lh_emits.add((r.local_column, key))
-            schema.tables[r.table].rh_emits.add(r.remote_column)
+            if not schema.tables[r.table].include: continue
+            if r.local_column is None: continue
+            lh_emits.add((r.local_column, "%s.%s" % (r.table, r.remote_column)))
+        rh_emits = set(r.remote_column for referrer, r in schema.incoming(t.name)
+                       if referrer.include and r.remote_column is not None)
+        if len(lh_emits) + len(rh_emits) > 0:
+            emits[t.name] = (lh_emits, rh_emits)
+    return emits
+
+def compute_view(schema, tables=None):
+    emits = join_emits(schema)
 
     view = ["function(doc) {"]
     for t in schema.tables.values():
-        if len(t.lh_emits) + len(t.rh_emits) < 1:
+        if t.name not in emits:
+            continue
+        if tables is not None and t.name not in tables:
             continue
+        lh_emits, rh_emits = emits[t.name]
 
         view.append('  if(doc.type == "%s") {' % t.name)
-        for e in t.lh_emits:
+        for e in lh_emits:
             col, key = e
             field = 'doc["%s"]' % col
             view.append('    %s && emit(["%s" + %s, 1], null);' % \
                             (field, key, field))
 
-        for col in t.rh_emits:
+        for col in rh_emits:
             key = "%s.%s" % (t.name, col)
             field = 'doc["%s"]' % col
             view.append('    %s && emit(["%s" + %s, 0], null);' % \
@@ -36,17 +50,109 @@ def compute_view(schema):
     view.append('}')
     return "\n".join(view)
 
+def design_doc(view):
+    return {"language":"javascript",
+            "views":
+                {"joins":
+                     {"map": view,
+                      "reduce": "_count"}
+                 }
+            }
+
+def shard_tables(schema, shards=None, row_counts=None):
+    # CouchDB builds the views of one design document together, so tables
+    # spread over several design documents are indexed in parallel. With
+    # no shard count every table gets its own; otherwise tables are packed
+    # largest first into the shard with the fewest estimated rows.
+    tables = join_emits(schema).keys()
+    if shards is None:
+        return [[name] for name in sorted(tables)]
+
+    row_counts = row_counts or {}
+    groups = [[] for i in range(min(shards, len(tables)))]
+    sizes = [0] * len(groups)
+    for name in sorted(tables, key=lambda n: row_counts.get(n, 1), reverse=True):
+        i = sizes.index(min(sizes))
+        groups[i].append(name)
+        sizes[i] += row_counts.get(name, 1)
+    return groups
+
+def sharded_design_docs(schema, shards=None, row_counts=None):
+    docs = []
+    for i, tables in enumerate(shard_tables(schema, shards, row_counts)):
+        doc = design_doc(compute_view(schema, set(tables)))
+        doc["_id"] = "_design/joins-%d" % i
+        doc["tables"] = tables
+        docs.append(doc)
+    return docs
+
+def save_design_docs(db, docs):
+    for doc in docs:
+        current = db.get(doc["_id"])
+        if current is not None:
+            doc["_rev"] = current["_rev"]
+        db.save(doc)
+
+def warm_up(server, db, docs, poll_interval=POLL_INTERVAL):
+    # Querying a view starts its index build; each query blocks until the
+    # index is current, so they run in threads while the indexer tasks are
+    # polled for progress.
+    errors = []
+    def query(doc):
+        try:
+            db.view(doc["_id"][len("_design/"):] + "/joins", limit=0).total_rows
+        except Exception, e:
+            errors.append((doc["_id"], e))
+
+    threads = [threading.Thread(target=query, args=(doc,)) for doc in docs]
+    for t in threads:
+        t.daemon = True
+        t.start()
+
+    start = time.time()
+    alive = threads
+    while alive:
+        alive[0].join(poll_interval)
+        progress = ["%s %s%%" % (task.get("design_document"), task.get("progress"))
+                    for task in server.tasks()
+                    if task.get("type") == "indexer" and task.get("database") == db.name]
+        print "indexing: %.0f s: %s" % (time.time() - start,
+                                         ", ".join(progress) or "waiting")
+        alive = [t for t in threads if t.is_alive()]
+    for design, e in errors:
+        print "index build failed: %s: %s" % (design, e)
+    return not errors
+
+def report_row_counts(filename):
+    # Estimated rows per table, as recorded by `importmysql -m`.
+    with open(filename) as report:
+        return dict((t["name"], t["rows"]) for t in json.load(report)["tables"])
+
 if __name__ == '__main__':
+    import getopt
     import sys
-    import json
-    from jsonschema import json2schema
-
-    schema = json2schema(json.load(sys.stdin))
-    view = compute_view(schema)
-    print json.dumps({"language":"javascript",
-                      "views":
-                          {"joins":
-                               {"map": view,
-                                "reduce": "_count"}
-                           }
-                      })
+    import couchdb
+    from jsonschema import json2schema, load_json_schema
+
+    optlist, args = getopt.getopt(sys.argv[1:], 'n:tr:S:d:w')
+    options = dict(optlist)
+    schema = load_json_schema(args[0]) if args else json2schema(json.load(sys.stdin))
+
+    if "-n" not in options and "-t" not in options:
+        print json.dumps(design_doc(compute_view(schema)))
+        sys.exit()
+
+    row_counts = report_row_counts(options["-r"]) if "-r" in options else None
+    shards = int(options["-n"]) if "-n" in options else None
+    docs = sharded_design_docs(schema, shards, row_counts)
+
+    if "-d" not in options:
+        print json.dumps({"docs": docs})
+        sys.exit()
+
+    server = couchdb.Server(options.get("-S") or couchdb.client.DEFAULT_BASE_URL)
+    db = server[options["-d"]]
+    save_design_docs(db, docs)
+    print "saved %d design documents" % len(docs)
+    if "-w" in options and not warm_up(server, db, docs):
+        sys.exit(1)
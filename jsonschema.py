@@ -1,5 +1,7 @@
 import json
-from schema import Schema, Table, Column, Relationship
+from schema import Schema, Table, Column, Relationship, Index, \
+    make_relationship
+from schemacache import cached_schema
 
 class SchemaEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -9,17 +11,26 @@ class SchemaEncoder(json.JSONEncoder):
         if isinstance(obj, Table):
             return {"columns": obj.columns,
                     "relationships": obj.relationships,
+                    "indexes": obj.indexes,
                     "primary_key": obj.primary_key,
                     "include": obj.include}
 
+        if isinstance(obj, Index):
+            return {"columns": obj.columns,
+                    "unique": obj.unique,
+                    "primary": obj.primary}
+
         if isinstance(obj, Column):
             return {"mysql_type": obj.mysql_type,
-                    "options": obj.options}
+                    "options": obj.options,
+                    "include": obj.include}
 
         if isinstance(obj, Relationship):
             return {"name": obj.name,
                     "remote_table": obj.table,
                     "remote_column": obj.remote_column,
+                    "local_columns": obj.local_columns,
+                    "remote_columns": obj.remote_columns,
                     "action": obj.action}
 
         return json.JSONEncoder.default(self, obj)
@@ -33,13 +44,30 @@ def json2schema(data):
 
         for c, r in t["relationships"].items():
             relationship = table.relationships[c] = \
-                Relationship(r["name"], c,
-                             r["remote_table"],
-                             r["remote_column"])
+                make_relationship(r["name"],
+                                  r.get("local_columns", [c]),
+                                  r["remote_table"],
+                                  r.get("remote_columns", [r["remote_column"]]))
 
             relationship.action = r["action"]
 
+        for name, i in t.get("indexes", {}).items():
+            table.indexes[name] = Index(name, i["columns"],
+                                        i["unique"], i["primary"])
+        if "indexes" not in t and table.primary_key is not None:
+            # Schemas written before indexes were kept still had one.
+            table.indexes["PRIMARY"] = Index("PRIMARY", [table.primary_key],
+                                             primary=True)
+
         for name, c in t["columns"].items():
             column = table.columns[name] = \
                 Column(name, c["mysql_type"], c["options"])
+            column.include = c.get("include", True)
     return schema
+
+def read_json_schema(filename):
+    with open(filename) as source:
+        return json2schema(json.load(source))
+
+def load_json_schema(filename):
+    return cached_schema(filename, read_json_schema)
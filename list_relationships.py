@@ -1,19 +1,210 @@
-from jsonschema import json2schema
+import json
+from collections import deque
+
+from jsonschema import json2schema, load_json_schema, read_json_schema
+from schemacache import cached_schema
+
+INDEX_SUFFIX = ".relindex"
+DIRECTIONS = ("out", "in", "both")
 
 def list_relationships(schema):
     out = []
     for table in schema.tables.values():
         if not table.include: continue
         rels = ["n %s.%s -> %s.%s" % \
-                    (table.name, r.local_column,
-                     r.table, r.remote_column)
+                    (table.name, ",".join(r.local_columns),
+                     r.table, ",".join(r.remote_columns))
                 for r in table.relationships.values()
                 if schema.tables[r.table].include]
         out.extend(rels)
     return "\n".join(out)
 
+# The query commands work on an index of the included relationships: per
+# table, its outgoing and incoming edges, each edge a tuple
+# (table, local columns, referenced table, remote columns). The index is
+# plain dicts and tuples so it pickles next to the schema file and later
+# queries skip reading the schema at all.
+
+def build_index(schema):
+    def edge(t, r):
+        return (t.name, r.local_columns, r.table, r.remote_columns)
+
+    index = {"out": {}, "in": {}}
+    for table in schema.tables.values():
+        if not table.include: continue
+        index["out"][table.name] = sorted(
+            edge(table, r) for r in table.relationships.values()
+            if r.table in schema.tables and schema.tables[r.table].include)
+        index["in"][table.name] = sorted(
+            edge(t, r) for t, r in schema.incoming(table.name) if t.include)
+    return index
+
+def load_index(filename):
+    return cached_schema(filename, lambda f: build_index(read_json_schema(f)),
+                         filename + INDEX_SUFFIX)
+
+def steps(index, table, direction):
+    # (neighbor, edge, forward) for each edge leaving table in a direction.
+    if direction in ("out", "both"):
+        for edge in index["out"].get(table, ()):
+            yield edge[2], edge, True
+    if direction in ("in", "both"):
+        for edge in index["in"].get(table, ()):
+            yield edge[0], edge, False
+
+def check_table(index, table):
+    if table not in index["out"]:
+        raise KeyError("no such table: %s" % table)
+
+def traverse(index, start, depth, direction="both"):
+    # Breadth first: (distance, edge, forward) for every edge reaching a
+    # table first seen within depth.
+    check_table(index, start)
+    seen = set([start])
+    frontier = [start]
+    for distance in range(1, depth + 1):
+        following = []
+        for table in frontier:
+            for neighbor, edge, forward in steps(index, table, direction):
+                if neighbor in seen: continue
+                seen.add(neighbor)
+                following.append(neighbor)
+                yield distance, edge, forward
+        frontier = following
+
+def distances(index, start, direction, limit):
+    # Hops from every table within limit to start, against direction.
+    reverse = {"out": "in", "in": "out", "both": "both"}[direction]
+    dist = {start: 0}
+    queue = deque([start])
+    while queue:
+        table = queue.popleft()
+        if dist[table] == limit: continue
+        for neighbor, edge, forward in steps(index, table, reverse):
+            if neighbor not in dist:
+                dist[neighbor] = dist[table] + 1
+                queue.append(neighbor)
+    return dist
+
+def shortest_path(index, source, target, direction="both", limit=None):
+    check_table(index, source)
+    check_table(index, target)
+    came_from = {source: None}
+    queue = deque([(source, 0)])
+    while queue:
+        table, length = queue.popleft()
+        if table == target:
+            path = []
+            while came_from[table] is not None:
+                table, edge, forward = came_from[table]
+                path.append((edge, forward))
+            return path[::-1]
+        if limit is not None and length == limit: continue
+        for neighbor, edge, forward in steps(index, table, direction):
+            if neighbor not in came_from:
+                came_from[neighbor] = (table, edge, forward)
+                queue.append((neighbor, length + 1))
+    return None
+
+def simple_paths(index, source, target, limit, direction="both"):
+    # Every path visiting no table twice, up to limit edges. Tables further
+    # from the target than the edges left are never entered, so the search
+    # only walks the part of the graph the answers lie in.
+    check_table(index, source)
+    check_table(index, target)
+    dist = distances(index, target, direction, limit)
+    if source not in dist:
+        return
+    path = []
+    visited = set([source])
+    stack = [steps(index, source, direction)]
+    while stack:
+        for neighbor, edge, forward in stack[-1]:
+            if neighbor in visited: continue
+            if len(path) + 1 + dist.get(neighbor, limit + 1) > limit: continue
+            path.append((edge, forward))
+            if neighbor == target:
+                yield list(path)
+                path.pop()
+                continue
+            visited.add(neighbor)
+            stack.append(steps(index, neighbor, direction))
+            break
+        else:
+            stack.pop()
+            if path:
+                edge, forward = path.pop()
+                visited.discard(edge[2] if forward else edge[0])
+
+def format_edge(edge, forward=True):
+    table, local_columns, remote_table, remote_columns = edge
+    if forward:
+        return "%s.%s -> %s.%s" % (table, ",".join(local_columns),
+                                   remote_table, ",".join(remote_columns))
+    return "%s.%s <- %s.%s" % (remote_table, ",".join(remote_columns),
+                               table, ",".join(local_columns))
+
+def format_path(path):
+    return " ".join(format_edge(edge, forward) for edge, forward in path)
+
+def query_lines(index, command, args, direction="both"):
+    if command in ("out", "in"):
+        check_table(index, args[0])
+        for edge in index[command].get(args[0], ()):
+            yield format_edge(edge)
+    elif command == "near":
+        depth = int(args[1]) if len(args) > 1 else 1
+        for distance, edge, forward in traverse(index, args[0], depth, direction):
+            yield "%d %s" % (distance, format_edge(edge, forward))
+    elif command == "path":
+        limit = int(args[2]) if len(args) > 2 else None
+        path = shortest_path(index, args[0], args[1], direction, limit)
+        if path is not None:
+            yield format_path(path)
+    elif command == "paths":
+        for path in simple_paths(index, args[0], args[1], int(args[2]), direction):
+            yield format_path(path)
+    else:
+        raise ValueError("unknown command: %s" % command)
+
+USAGE = """usage: list_relationships.py [schema.json]
+       list_relationships.py [-d out|in|both] schema.json COMMAND ARGS...
+commands: out TABLE | in TABLE | near TABLE [DEPTH]
+          path FROM TO [MAXLEN] | paths FROM TO MAXLEN"""
+
+# Per command: how many table names, then the least and most arguments;
+# the arguments after the table names are numbers.
+COMMAND_ARGS = {"out": (1, 1, 1), "in": (1, 1, 1), "near": (1, 1, 2),
+                "path": (2, 2, 3), "paths": (2, 3, 3)}
+
 if __name__ == '__main__':
+    import getopt
     import sys
-    import json
-    schema = json2schema(json.load(sys.stdin))
-    print list_relationships(schema)
+
+    try:
+        optlist, args = getopt.getopt(sys.argv[1:], 'd:')
+    except getopt.GetoptError, e:
+        sys.exit("%s\n%s" % (e, USAGE))
+    options = dict(optlist)
+    direction = options.get("-d", "both")
+    if direction not in DIRECTIONS:
+        sys.exit("unknown direction: %s\n%s" % (direction, USAGE))
+
+    if len(args) > 1:
+        command, command_args = args[1], args[2:]
+        if command not in COMMAND_ARGS:
+            sys.exit("unknown command: %s\n%s" % (command, USAGE))
+        tables, least, most = COMMAND_ARGS[command]
+        if not least <= len(command_args) <= most or \
+                not all(arg.isdigit() for arg in command_args[tables:]):
+            sys.exit(USAGE)
+        try:
+            for line in query_lines(load_index(args[0]), command, command_args,
+                                    direction):
+                print line
+        except KeyError, e:
+            sys.exit(e.args[0])
+    else:
+        schema = load_json_schema(args[0]) if args \
+            else json2schema(json.load(sys.stdin))
+        print list_relationships(schema)
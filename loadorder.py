@@ -0,0 +1,127 @@
+def dependencies(schema):
+    # Tables each table refers to, i.e. has to be loaded after. Only
+    # relationships between included tables count.
+    deps = {}
+    for t in schema.tables.values():
+        deps[t.name] = [(r.table, r) for r in t.relationships.values()
+                        if t.include and r.table in schema.tables
+                        and schema.tables[r.table].include]
+    return deps
+
+def strongly_connected_components(deps):
+    # Tarjan's algorithm, iterative so long reference chains do not hit
+    # the recursion limit. Components come out dependencies first.
+    index, lowlink, on_stack = {}, {}, set()
+    stack, components = [], []
+    for root in sorted(deps):
+        if root in index: continue
+        work = [(root, iter(deps[root]))]
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            node, edges = work[-1]
+            for target, rel in edges:
+                if target not in index:
+                    index[target] = lowlink[target] = len(index)
+                    stack.append(target)
+                    on_stack.add(target)
+                    work.append((target, iter(deps[target])))
+                    break
+                if target in on_stack:
+                    lowlink[node] = min(lowlink[node], index[target])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.remove(member)
+                        component.append(member)
+                        if member == node: break
+                    components.append(sorted(component))
+    return components
+
+def is_nullable(schema, table_name, rel):
+    columns = [schema.tables[table_name].columns.get(c) for c in rel.local_columns]
+    return any(c is None or "NOT NULL" not in c.options.upper() for c in columns)
+
+class LoadPlan:
+    def __init__(self):
+        self.levels = []
+        self.cycles = []
+        self.broken = []
+
+    def order(self):
+        return [name for level in self.levels for name in level]
+
+    def __str__(self):
+        out = ["level %d: %s" % (i, " ".join(level))
+               for i, level in enumerate(self.levels)]
+        out.extend("cycle: %s" % " ".join(cycle) for cycle in self.cycles)
+        out.extend("broken: %s.%s -> %s.%s" % (name, ",".join(r.local_columns),
+                                              r.table, ",".join(r.remote_columns))
+                   for name, r in self.broken)
+        return "\n".join(out)
+
+def plan_loads(schema):
+    # Ready sets: each level holds the tables whose referenced tables are
+    # all in earlier levels, so a level can be loaded concurrently. Cycles
+    # are broken by dropping references, nullable foreign keys first; rows
+    # then point at tables loaded later or alongside them.
+    deps = dependencies(schema)
+    plan = LoadPlan()
+    dropped = set()
+
+    for component in strongly_connected_components(deps):
+        self_references = [(name, rel) for name in component
+                           for target, rel in deps[name] if target == name]
+        for name, rel in self_references:
+            dropped.add((name, rel.local_columns))
+            plan.broken.append((name, rel))
+        if len(component) > 1 or self_references:
+            plan.cycles.append(component)
+        if len(component) == 1:
+            continue
+
+        remaining = set(component)
+        while remaining:
+            inside = dict((name, [(target, rel) for target, rel in deps[name]
+                                  if target in remaining and target != name
+                                  and (name, rel.local_columns) not in dropped])
+                          for name in remaining)
+            ready = [name for name in remaining if not inside[name]]
+            if not ready:
+                # Break the member held back by the fewest required keys.
+                name = min(sorted(remaining), key=lambda n: (
+                        sum(1 for t, r in inside[n] if not is_nullable(schema, n, r)),
+                        len(inside[n])))
+                for target, rel in inside[name]:
+                    dropped.add((name, rel.local_columns))
+                    plan.broken.append((name, rel))
+                ready = [name]
+            remaining.difference_update(ready)
+
+    pending = dict((name, set(target for target, rel in deps[name]
+                              if (name, rel.local_columns) not in dropped))
+                   for name in deps)
+    while pending:
+        level = sorted(name for name, waiting in pending.items() if not waiting)
+        plan.levels.append(level)
+        for name in level:
+            del pending[name]
+        for waiting in pending.values():
+            waiting.difference_update(level)
+    return plan
+
+if __name__ == '__main__':
+    import sys
+    import json
+    from jsonschema import json2schema, load_json_schema
+
+    schema = load_json_schema(sys.argv[1]) if len(sys.argv) > 1 \
+        else json2schema(json.load(sys.stdin))
+    print plan_loads(schema)
@@ -0,0 +1,144 @@
+import json
+import time
+
+REPORT_INTERVAL = 10.0
+
+def format_duration(seconds):
+    if seconds is None:
+        return "?"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return "%d:%02d:%02d" % (hours, minutes, seconds)
+
+class TableMetrics:
+    def __init__(self, name, expected_rows=None):
+        self.name = name
+        self.expected_rows = expected_rows
+        self.rows = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.fetch_time = 0.0
+        self.convert_time = 0.0
+        self.upload_time = 0.0
+        self.started = self.last_report = time.time()
+        self.finished = None
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.time()) - self.started
+
+    def rate(self):
+        elapsed = self.elapsed
+        return self.rows / elapsed if elapsed > 0 else 0.0
+
+    def eta(self):
+        rate = self.rate()
+        if self.expected_rows is None or rate <= 0:
+            return None
+        return max(0, self.expected_rows - self.rows) / rate
+
+    def add_rows(self, n):
+        self.rows += n
+        now = time.time()
+        if now - self.last_report >= REPORT_INTERVAL:
+            self.last_report = now
+            print "progress: %s" % self.progress()
+
+    def progress(self):
+        expected = "?" if self.expected_rows is None else self.expected_rows
+        return "%s: %d/%s rows, %.0f rows/s, ETA %s" % (
+            self.name, self.rows, expected, self.rate(),
+            format_duration(self.eta()))
+
+    def finish(self, writer_stats=None, bytes_read=0):
+        if writer_stats is not None:
+            self.bytes_written += writer_stats.nbytes
+            self.upload_time += writer_stats.latency
+        self.bytes_read += bytes_read
+        self.finished = time.time()
+        return self
+
+    def merge(self, other):
+        self.rows += other.rows
+        self.bytes_read += other.bytes_read
+        self.bytes_written += other.bytes_written
+        self.fetch_time += other.fetch_time
+        self.convert_time += other.convert_time
+        self.upload_time += other.upload_time
+        self.started = min(self.started, other.started)
+        self.finished = max(self.finished, other.finished)
+
+    def as_dict(self):
+        return {"name": self.name,
+                "rows": self.rows,
+                "expected_rows": self.expected_rows,
+                "elapsed": self.elapsed,
+                "rows_per_second": self.rate(),
+                "bytes_read": self.bytes_read,
+                "bytes_written": self.bytes_written,
+                "fetch_time": self.fetch_time,
+                "convert_time": self.convert_time,
+                "upload_time": self.upload_time}
+
+    def __str__(self):
+        return ("%s: %d rows in %.1f s (%.0f rows/s), %.1f MB read, "
+                "%.1f MB written, fetch %.1f s, convert %.1f s, upload %.1f s") % (
+            self.name, self.rows, self.elapsed, self.rate(),
+            self.bytes_read / 1048576.0, self.bytes_written / 1048576.0,
+            self.fetch_time, self.convert_time, self.upload_time)
+
+class RunMetrics:
+    def __init__(self, expected_rows=None):
+        self.expected_rows = expected_rows
+        self.tables = []
+        self.started = time.time()
+        self.finished = None
+
+    def add(self, table_metrics):
+        self.tables.append(table_metrics)
+        print "finished table: %s" % table_metrics
+        print "progress: %s" % self.progress()
+
+    @property
+    def rows(self):
+        return sum(t.rows for t in self.tables)
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.time()) - self.started
+
+    def rate(self):
+        elapsed = self.elapsed
+        return self.rows / elapsed if elapsed > 0 else 0.0
+
+    def eta(self):
+        rate = self.rate()
+        if self.expected_rows is None or rate <= 0:
+            return None
+        return max(0, self.expected_rows - self.rows) / rate
+
+    def progress(self):
+        expected = "?" if self.expected_rows is None else self.expected_rows
+        return "run: %d tables, %d/%s rows, %.0f rows/s, ETA %s" % (
+            len(self.tables), self.rows, expected, self.rate(),
+            format_duration(self.eta()))
+
+    def finish(self):
+        self.finished = time.time()
+        return self
+
+    def as_dict(self):
+        totals = {}
+        for key in ("bytes_read", "bytes_written",
+                    "fetch_time", "convert_time", "upload_time"):
+            totals[key] = sum(getattr(t, key) for t in self.tables)
+        totals.update({"rows": self.rows,
+                       "expected_rows": self.expected_rows,
+                       "elapsed": self.elapsed,
+                       "rows_per_second": self.rate()})
+        return {"run": totals,
+                "tables": [t.as_dict() for t in self.tables]}
+
+    def write_report(self, filename):
+        with open(filename, "w") as out:
+            json.dump(self.as_dict(), out, indent=4)
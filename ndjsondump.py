@@ -0,0 +1,138 @@
+import errno
+import gzip
+import io
+import json
+import os
+import re
+import threading
+
+from bulk import BulkWriter, ConcurrentWriter, BatchBudget, HttpSink, \
+    INITIAL_BATCH_BYTES, encode_json
+
+ROTATE_BYTES = 1 << 30
+COMPRESSIONS = {None: "", "gzip": ".gz", "zstd": ".zst"}
+
+unsafe_filename_re = re.compile(r"[^\w.-]+")
+
+def open_compressed(filename, mode, compression=None):
+    if compression is None:
+        compression = dict((ext, name) for name, ext in COMPRESSIONS.items()
+                           if ext).get(os.path.splitext(filename)[1])
+    if compression == "gzip":
+        return gzip.open(filename, mode)
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("zstd compression needs the zstandard package")
+        raw = open(filename, mode)
+        if "r" in mode:
+            return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(raw))
+        return zstandard.ZstdCompressor().stream_writer(raw)
+    return open(filename, mode)
+
+class FileSink:
+    def __init__(self, directory, compression=None):
+        if compression not in COMPRESSIONS:
+            raise ValueError("unknown compression: %s" % compression)
+        # Pool workers each open the sink; only one of them creates it.
+        try:
+            os.makedirs(directory)
+        except OSError, e:
+            if e.errno != errno.EEXIST or not os.path.isdir(directory):
+                raise
+        self.directory = directory
+        self.compression = compression
+
+    def for_table(self, label):
+        return TableFile(self, unsafe_filename_re.sub("_", label))
+
+class TableFile:
+    def __init__(self, sink, name):
+        self.sink = sink
+        self.name = name
+        self.lock = threading.Lock()
+        self.out = None
+        self.written = 0
+        # A resumed run starts a new part rather than appending to a file
+        # that may end in a torn line or an unterminated compressed frame.
+        self.part = 0
+        while os.path.exists(self.filename()):
+            self.part += 1
+
+    def filename(self):
+        return os.path.join(self.sink.directory, "%s.%04d.ndjson%s" % (
+                self.name, self.part, COMPRESSIONS[self.sink.compression]))
+
+    def encode(self, doc):
+        item = encode_json(doc)
+        return item, len(item) + 1
+
+    def bulk_docs(self, items):
+        data = "\n".join(items) + "\n"
+        with self.lock:
+            if self.out is None:
+                self.out = open_compressed(self.filename(), "wb", self.sink.compression)
+            self.out.write(data)
+            self.out.flush()
+            self.written += len(data)
+            if self.written >= ROTATE_BYTES:
+                self.close()
+                self.part += 1
+                self.written = 0
+        return []
+
+    def close(self):
+        if self.out is not None:
+            self.out.close()
+            self.out = None
+
+def read_docs(filename):
+    with open_compressed(filename, "rb") as lines:
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+
+def load_file(filename, url, batch_bytes=INITIAL_BATCH_BYTES, concurrency=1):
+    sink = HttpSink(url, concurrency)
+    if concurrency > 1:
+        writer = ConcurrentWriter(sink, concurrency, BatchBudget(batch_bytes))
+    else:
+        writer = BulkWriter(sink, BatchBudget(batch_bytes))
+    try:
+        writer.add(read_docs(filename))
+    except:
+        writer.abort()
+        raise
+    writer.close()
+    print "loaded %s: %s" % (filename, writer.stats)
+    return writer.stats.docs
+
+def load_file_worker(args):
+    return load_file(*args)
+
+if __name__ == '__main__':
+    import getopt
+    import sys
+    import couchdb
+
+    optlist, args = getopt.getopt(sys.argv[1:], 'S:j:w:b:')
+    options = dict(optlist)
+    url = (options.get("-S") or couchdb.client.DEFAULT_BASE_URL).rstrip("/") \
+        + "/" + args[0]
+    workers = int(options.get("-j", 1))
+    tasks = [(filename, url, int(options.get("-b", INITIAL_BATCH_BYTES)),
+              int(options.get("-w", 1)))
+             for filename in args[1:]]
+
+    # Largest dumps first so one big table does not finish last on its own.
+    tasks.sort(key=lambda task: os.path.getsize(task[0]), reverse=True)
+    if workers > 1:
+        from multiprocessing import Pool
+        pool = Pool(workers)
+        total = sum(pool.imap_unordered(load_file_worker, tasks))
+        pool.close()
+        pool.join()
+    else:
+        total = sum(load_file_worker(task) for task in tasks)
+    print "loaded %d documents from %d files" % (total, len(tasks))
@@ -0,0 +1,150 @@
+import binascii
+import re
+
+# Decodes the data sections of a mysqldump: one INSERT statement per line,
+# each holding many "(v1,v2,...)" tuples. The dump is indexed once to find
+# every table's column order and the byte spans of its INSERT lines; the
+# spans are then parsed a statement at a time.
+
+insert_re = re.compile(r"INSERT INTO `(?P<table>[^`]+)`(?: \((?P<columns>[^)]*)\))? VALUES ")
+column_line_re = re.compile(r"\s+`(?P<name>[^`]+)`")
+quoted_name_re = re.compile(r"`([^`]+)`")
+value_re = re.compile(r"(?:'(?P<string>(?:[^'\\]|\\.|'')*)'"
+                      r"|(?P<null>NULL)"
+                      r"|_binary '(?P<binary>(?:[^'\\]|\\.|'')*)'"
+                      r"|0x(?P<hex>[0-9A-Fa-f]*)"
+                      r"|b'(?P<bits>[01]*)'"
+                      r"|(?P<number>[-+0-9.eE]+))"
+                      r"(?P<end>[,)])")
+escape_re = re.compile(r"\\(.)|''", re.DOTALL)
+ESCAPES = {"0": "\0", "n": "\n", "r": "\r", "t": "\t", "b": "\b", "Z": "\x1a"}
+
+CREATE_TABLE = "CREATE TABLE `"
+INSERT_INTO = "INSERT INTO `"
+
+def next_statement(data, prefix, pos):
+    pos = data.find("\n" + prefix, pos)
+    return pos if pos < 0 else pos + 1
+
+def first_statement(data, prefix):
+    # A dump without a comment header starts right at a statement.
+    return 0 if data[:len(prefix)] == prefix else next_statement(data, prefix, 0)
+
+def index_dump(data):
+    # Column order from each CREATE TABLE, and the merged byte spans of
+    # each table's INSERT lines, found by jumping between statement starts.
+    columns, sections = {}, {}
+
+    start = first_statement(data, CREATE_TABLE)
+    while start >= 0:
+        line_end = data.find("\n", start)
+        end = data.find(";\n", line_end)
+        if line_end < 0 or end < 0: break
+        name = quoted_name_re.search(data[start:line_end]).group(1)
+        columns[name] = [m.group("name") for m in
+                         map(column_line_re.match, data[line_end + 1:end].split("\n"))
+                         if m is not None]
+        start = next_statement(data, CREATE_TABLE, end)
+
+    start = first_statement(data, INSERT_INTO)
+    while start >= 0:
+        end = data.find("\n", start)
+        if end < 0:
+            end = len(data)
+        name = data[start + 13:data.find("`", start + 13)]
+        spans = sections.setdefault(name, [])
+        if spans and spans[-1][1] + 1 == start:
+            spans[-1] = (spans[-1][0], end)
+        else:
+            spans.append((start, end))
+        start = next_statement(data, INSERT_INTO, end)
+    return columns, sections
+
+def statements(data, spans, order):
+    # (column names, rows) for each INSERT statement in the spans.
+    for start, end in spans:
+        while start < end:
+            line_end = data.find("\n", start, end)
+            if line_end < 0:
+                line_end = end
+            text = data[start:line_end]
+            start = line_end + 1
+
+            match = insert_re.match(text)
+            if match is None: continue
+            if match.group("columns") is not None:
+                columns = quoted_name_re.findall(match.group("columns"))
+            else:
+                columns = order
+            yield columns, parse_values(text, match.end())
+
+def parse_values(text, pos):
+    rows = []
+    match = value_re.match
+    while text.startswith("(", pos):
+        pos += 1
+        row = []
+        while True:
+            m = match(text, pos)
+            if m is None:
+                raise ValueError("can not parse value at: %s" % text[pos:pos + 40])
+            row.append(decode_value(m))
+            pos = m.end()
+            if m.group("end") == ")": break
+        rows.append(row)
+        if text.startswith(",", pos):
+            pos += 1
+    return rows
+
+def unescape(s):
+    if "\\" not in s and "''" not in s:
+        return s
+    return escape_re.sub(lambda m: "'" if m.group(1) is None
+                         else ESCAPES.get(m.group(1), m.group(1)), s)
+
+def decode_value(m):
+    s = m.group("string")
+    if s is not None: return unescape(s)
+    if m.group("null") is not None: return None
+    s = m.group("number")
+    if s is not None: return s
+    s = m.group("binary")
+    if s is not None: return unescape(s)
+    s = m.group("hex")
+    if s is not None: return binascii.unhexlify(s)
+    return int(m.group("bits"), 2)
+
+# Values as importmysql gets them from MySQLdb with its field conversions.
+
+def to_datetime(s):
+    if s.startswith("0000-00-00"): return None
+    return s.replace(" ", "T")
+
+def to_date(s):
+    if s.startswith("0000-00-00"): return None
+    return s
+
+def to_text(s):
+    return s.decode("utf8")
+
+def to_bit(v):
+    # BIT(1) is dumped as a quoted or hex byte, and b'1' decodes to 1.
+    return v == "\x01" or v == 1
+
+def column_converter(mysql_type):
+    t = mysql_type.lower()
+    if re.match(r"(tiny|small|medium|big)?int\b|year\b", t):
+        return int
+    if t.startswith(("float", "double", "real")):
+        return float
+    if t.startswith(("decimal", "numeric")):
+        return str
+    if t.startswith("bit"):
+        return to_bit
+    if t.startswith(("datetime", "timestamp")):
+        return to_datetime
+    if t.startswith("date"):
+        return to_date
+    if t.endswith("blob") or t.startswith(("binary", "varbinary")):
+        return str
+    return to_text
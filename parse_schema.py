@@ -1,14 +1,21 @@
+import mmap
+import os
 import re
+from cStringIO import StringIO
 from schema import *
+from schemacache import cached_schema
 
 create_table_re = re.compile(r"CREATE TABLE `(?P<table_name>\w*)`")
 end_create_table_re = re.compile(r".*;$")
 column_re = re.compile(r"\s*`(?P<name>\w+)`\s(?P<type>[^\s]+)\s(?P<options>[^\,]*)\,")
-primary_key_re = re.compile(r"\s*PRIMARY KEY\s+\(`(?P<name>[^`]+)`\)")
+primary_key_re = re.compile(r"\s*PRIMARY KEY\s+(?:USING \w+\s+)?\((?P<columns>.*)\)")
+key_re = re.compile(r"\s*(?P<kind>UNIQUE |FULLTEXT |SPATIAL )?(?:KEY|INDEX)\s+" +
+                    r"`(?P<name>[^`]+)`\s+(?:USING \w+\s+)?\((?P<columns>.*)\)")
 foreign_key_re =re.compile(r"\s*CONSTRAINT\s+`(?P<name>\w+)`\s+FOREIGN KEY\s+" +
-                           r"\(`(?P<localcol>[^`]+)`\)\s+REFERENCES\s+" +
+                           r"\((?P<localcols>[^)]+)\)\s+REFERENCES\s+" +
                            r"`(?P<table>[^`]+)`\s+" +
-                           r"\(`(?P<remotecol>[^`]+)`\)")
+                           r"\((?P<remotecols>[^)]+)\)")
+quoted_name_re = re.compile(r"`([^`]+)`")
 
 def parse_schema(lines_in):
     schema = Schema()
@@ -40,21 +47,71 @@ def parse_create_table(table_name, lines_in):
 
         match = primary_key_re.match(line)
         if match is not None:
-            table.primary_key = match.group('name')
+            columns = quoted_name_re.findall(match.group('columns'))
+            table.indexes["PRIMARY"] = Index("PRIMARY", columns, primary=True)
+            if len(columns) == 1:
+                table.primary_key = columns[0]
+            continue
+
+        match = key_re.match(line)
+        if match is not None:
+            name = match.group('name')
+            table.indexes[name] = Index(
+                name,
+                quoted_name_re.findall(match.group('columns')),
+                unique=match.group('kind') == "UNIQUE "
+                )
             continue
 
         match = foreign_key_re.match(line)
         if match is not None:
-            localcol = match.group('localcol')
-            table.relationships[localcol] = Relationship(
+            localcols = quoted_name_re.findall(match.group('localcols'))
+            table.relationships[relationship_key(localcols)] = make_relationship(
                 match.group('name'),
-                localcol,
+                localcols,
                 match.group('table'),
-                match.group('remotecol')
+                quoted_name_re.findall(match.group('remotecols'))
                 )
 
+def next_create_table(data, pos):
+    pos = data.find("\nCREATE TABLE `", pos)
+    return pos if pos < 0 else pos + 1
+
+def scan_schema(filename):
+    # Same result as parse_schema, but the dump is memory mapped and only
+    # the CREATE TABLE statements are looked at: the search jumps from one
+    # to the next, so data sections are skipped without being decoded.
+    schema = Schema()
+    with open(filename, "rb") as dump:
+        if os.fstat(dump.fileno()).st_size == 0:
+            return schema
+        data = mmap.mmap(dump.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            pos = 0 if data[:14] == "CREATE TABLE `" else next_create_table(data, 0)
+            while pos >= 0:
+                start = data.find("\n", pos)
+                if start < 0:
+                    start = len(data)
+                end = data.find(";\n", start)
+                end = len(data) if end < 0 else end + 2
+
+                match = create_table_re.match(data[pos:start])
+                if match is not None:
+                    table_name = match.group('table_name')
+                    lines_in = StringIO(data[start + 1:end])
+                    schema.tables[table_name] = parse_create_table(table_name, lines_in)
+                pos = next_create_table(data, end - 1)
+        finally:
+            data.close()
+    return schema
+
+def parse_schema_file(filename):
+    return cached_schema(filename, scan_schema, use_digest=False)
+
 if __name__ == '__main__':
     import sys
     import json
     from jsonschema import SchemaEncoder
-    print json.dumps(parse_schema(sys.stdin), cls=SchemaEncoder, indent=4)
+    schema = parse_schema_file(sys.argv[1]) if len(sys.argv) > 1 \
+        else parse_schema(sys.stdin)
+    print json.dumps(schema, cls=SchemaEncoder, indent=4)
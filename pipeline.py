@@ -0,0 +1,56 @@
+import sys
+import threading
+import Queue
+
+POLL_INTERVAL = 0.1
+
+class Pipeline:
+    def __init__(self, depth):
+        self.depth = depth
+        self.stopped = threading.Event()
+        self.errors = []
+        self.threads = []
+
+    def queue(self):
+        return Queue.Queue(self.depth)
+
+    def start(self, target, *args):
+        def run():
+            try:
+                target(*args)
+            except:
+                self.errors.append(sys.exc_info())
+                self.stopped.set()
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        self.threads.append(thread)
+
+    def put(self, queue, item):
+        while not self.stopped.is_set():
+            try:
+                queue.put(item, timeout=POLL_INTERVAL)
+                return
+            except Queue.Full:
+                pass
+
+    def get(self, queue):
+        while not self.stopped.is_set():
+            try:
+                return queue.get(timeout=POLL_INTERVAL)
+            except Queue.Empty:
+                pass
+        return None
+
+    def abort(self):
+        self.stopped.set()
+        self.join()
+
+    def join(self):
+        for thread in self.threads:
+            thread.join()
+
+        if self.errors:
+            exc_type, exc_value, tb = self.errors[0]
+            raise exc_type, exc_value, tb
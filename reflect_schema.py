@@ -0,0 +1,126 @@
+from schema import Schema, Table, Column, Index, make_relationship, \
+    relationship_key
+
+# Builds the same Schema parse_schema gets from a mysqldump, from four
+# information_schema queries covering every table of a database at once.
+
+COLUMNS_QUERY = (
+    "SELECT table_name, column_name, column_type, is_nullable, "
+    "column_default, extra FROM information_schema.columns "
+    "WHERE table_schema = %s ORDER BY table_name, ordinal_position")
+
+INDEXES_QUERY = (
+    "SELECT table_name, index_name, non_unique, column_name "
+    "FROM information_schema.statistics WHERE table_schema = %s "
+    "ORDER BY table_name, index_name, seq_in_index")
+
+FOREIGN_KEYS_QUERY = (
+    "SELECT table_name, constraint_name, column_name, "
+    "referenced_table_name, referenced_column_name "
+    "FROM information_schema.key_column_usage "
+    "WHERE table_schema = %s AND referenced_table_name IS NOT NULL "
+    "ORDER BY table_name, constraint_name, ordinal_position")
+
+def column_options(column_type, nullable, default, extra):
+    # Spelled the way mysqldump writes them.
+    options = []
+    if not nullable:
+        options.append("NOT NULL")
+    if default is not None:
+        if default.upper().startswith("CURRENT_TIMESTAMP") or \
+                column_type.startswith("bit"):
+            options.append("DEFAULT %s" % default)
+        else:
+            options.append("DEFAULT '%s'" % default.replace("'", "\\'"))
+    elif nullable:
+        # Also for text and blob columns, whose NULL default older dumps
+        # leave implicit; parse_schema only keeps them spelled out.
+        options.append("DEFAULT NULL")
+    extra = extra.replace("DEFAULT_GENERATED", "").strip()
+    if extra:
+        options.append(extra.upper())
+    return " ".join(options)
+
+def reflect_schema(mysql, database=None):
+    cursor = mysql.cursor()
+    if database is None:
+        cursor.execute("SELECT DATABASE()")
+        database = cursor.fetchone()[0]
+
+    schema = Schema()
+    cursor.execute(COLUMNS_QUERY, (database,))
+    for table_name, name, column_type, nullable, default, extra in cursor.fetchall():
+        table = schema.tables.get(table_name)
+        if table is None:
+            table = schema.tables[table_name] = Table(table_name)
+        table.columns[name] = Column(name, column_type, column_options(
+                column_type, nullable == "YES", default, extra or ""))
+
+    cursor.execute(INDEXES_QUERY, (database,))
+    keys = {}
+    for table_name, index_name, non_unique, column_name in cursor.fetchall():
+        if table_name in schema.tables:
+            key = (table_name, index_name)
+            if key not in keys:
+                keys[key] = (int(non_unique) == 0, [])
+            keys[key][1].append(column_name)
+    for (table_name, index_name), (unique, columns) in keys.items():
+        table = schema.tables[table_name]
+        primary = index_name == "PRIMARY"
+        table.indexes[index_name] = Index(index_name, columns, unique, primary)
+        if primary and len(columns) == 1:
+            table.primary_key = table.indexes[index_name].columns[0]
+
+    cursor.execute(FOREIGN_KEYS_QUERY, (database,))
+    constraints = {}
+    for table_name, name, column, remote_table, remote_column in cursor.fetchall():
+        if table_name in schema.tables:
+            local_columns, remote_columns = constraints.setdefault(
+                (table_name, name, remote_table), ([], []))
+            local_columns.append(column)
+            remote_columns.append(remote_column)
+    for (table_name, name, remote_table), (local_columns, remote_columns) \
+            in constraints.items():
+        schema.tables[table_name].relationships[relationship_key(local_columns)] = \
+            make_relationship(name, local_columns, remote_table, remote_columns)
+    return schema
+
+def reflect_databases(connect, databases, workers=4):
+    # One connection per database; the queries spend their time on the
+    # server, so threads are enough to run them side by side.
+    from multiprocessing.pool import ThreadPool
+
+    def reflect(database):
+        mysql = connect(database)
+        try:
+            return database, reflect_schema(mysql, database)
+        finally:
+            mysql.close()
+
+    pool = ThreadPool(max(1, min(workers, len(databases))))
+    try:
+        return dict(pool.map(reflect, databases))
+    finally:
+        pool.close()
+        pool.join()
+
+if __name__ == '__main__':
+    import getopt
+    import json
+    import sys
+    import MySQLdb
+    from jsonschema import SchemaEncoder
+
+    optlist, args = getopt.getopt(sys.argv[1:], 'u:p:H:j:')
+    options = dict(optlist)
+
+    def connect(database):
+        return MySQLdb.connect(user=options["-u"], passwd=options["-p"],
+                               host=options.get("-H", "localhost"), db=database,
+                               charset="utf8", use_unicode=True)
+
+    schemas = reflect_databases(connect, args, int(options.get("-j", 4)))
+    if len(args) == 1:
+        print json.dumps(schemas[args[0]], cls=SchemaEncoder, indent=4)
+    else:
+        print json.dumps(schemas, cls=SchemaEncoder, indent=4)
@@ -1,48 +1,124 @@
-class Schema:
+_names = {}
+
+def intern_name(name):
+    # intern() only takes byte strings; names from JSON are unicode.
+    if name is None:
+        return None
+    return _names.setdefault(name, name)
+
+class Schema(object):
+    __slots__ = ("tables", "_incoming")
+
     def __init__(self):
         self.tables = {}
+        self.invalidate()
+
+    def invalidate(self):
+        # The index is built on first use; call this after adding or
+        # removing tables or relationships.
+        self._incoming = None
+
+    def incoming(self, table_name):
+        # (table, relationship) pairs whose foreign key refers to table_name.
+        if self._incoming is None:
+            self._incoming = {}
+            for t in self.tables.values():
+                for r in t.relationships.values():
+                    self._incoming.setdefault(r.table, []).append((t, r))
+        return self._incoming.get(table_name, [])
 
     def __str__(self):
         tables = [str(t) for t in self.tables.values()]
         return "\n".join(tables)
 
-class Table:
+class Table(object):
+    __slots__ = ("name", "primary_key", "columns", "relationships", "indexes",
+                 "include")
+
     def __init__(self, name):
-        self.name = name
+        self.name = intern_name(name)
         self.primary_key = None
         self.columns = {}
         self.relationships = {}
+        self.indexes = {}
         self.include = True
 
+    def leading_indexes(self, column_name):
+        # Indexes usable for range scans and ordered reads on a column.
+        return [i for i in self.indexes.values() if i.columns[0] == column_name]
+
     def __str__(self):
         body = ["  %s" % str(c) for c in self.columns.values()]
 
         if self.primary_key is not None:
             body.append("  PRIMARY KEY `%s`" % self.primary_key)
+        elif "PRIMARY" in self.indexes:
+            body.append("  PRIMARY KEY (%s)" % column_list(self.indexes["PRIMARY"].columns))
+
+        body.extend(["  %s" % str(i) for i in self.indexes.values()
+                     if not i.primary])
 
         body.extend(["  %s" % str(r) for r in self.relationships.values()])
 
         return "create table `%s` (\n%s\n);\n" % (self.name, ",\n".join(body))
 
 
-class Column:
+class Column(object):
+    __slots__ = ("name", "mysql_type", "options", "include")
+
     def __init__(self, name, mysql_type, options):
-        self.name = name
-        self.mysql_type = mysql_type
-        self.options = options
+        self.name = intern_name(name)
+        self.mysql_type = intern_name(mysql_type)
+        self.options = intern_name(options)
+        self.include = True
 
     def __str__(self):
         return "`%s` %s %s" % (self.name, self.mysql_type, self.options)
 
-class Relationship:
-    def __init__(self, name, local_column, table, remote_column):
-        self.name = name
-        self.local_column = local_column
-        self.table = table
-        self.remote_column = remote_column
+class Index(object):
+    __slots__ = ("name", "columns", "unique", "primary")
+
+    def __init__(self, name, columns, unique=False, primary=False):
+        self.name = intern_name(name)
+        self.columns = tuple(intern_name(c) for c in columns)
+        self.unique = unique or primary
+        self.primary = primary
+
+    def __str__(self):
+        kind = "UNIQUE KEY" if self.unique else "KEY"
+        return "%s `%s` (%s)" % (kind, self.name, column_list(self.columns))
+
+class Relationship(object):
+    __slots__ = ("name", "local_column", "table", "remote_column", "action",
+                 "local_columns", "remote_columns")
+
+    def __init__(self, name, local_column, table, remote_column,
+                 local_columns=None, remote_columns=None):
+        # Composite foreign keys have local_column and remote_column set
+        # to None; all keys list their columns in local/remote_columns.
+        self.name = intern_name(name)
+        self.local_column = intern_name(local_column)
+        self.table = intern_name(table)
+        self.remote_column = intern_name(remote_column)
         self.action = "nop"
+        self.local_columns = tuple(intern_name(c) for c in
+                                   local_columns or (local_column,))
+        self.remote_columns = tuple(intern_name(c) for c in
+                                    remote_columns or (remote_column,))
 
     def __str__(self):
-        return "CONSTRAINT `%s` FOREIGN KEY (`%s`) REFERENCES `%s` (`%s`)" % (
-            self.name, self.local_column, self.table, self.remote_column)
+        return "CONSTRAINT `%s` FOREIGN KEY (%s) REFERENCES `%s` (%s)" % (
+            self.name, column_list(self.local_columns), self.table,
+            column_list(self.remote_columns))
+
+def column_list(columns):
+    return ",".join("`%s`" % c for c in columns)
+
+def relationship_key(local_columns):
+    # Relationships are keyed by local column; composite ones by all of them.
+    return intern_name(",".join(local_columns))
 
+def make_relationship(name, local_columns, table, remote_columns):
+    if len(local_columns) == 1:
+        return Relationship(name, local_columns[0], table, remote_columns[0])
+    return Relationship(name, None, table, None, local_columns, remote_columns)
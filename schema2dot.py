@@ -1,15 +1,19 @@
-from parse_schema import parse_schema
+from parse_schema import parse_schema, parse_schema_file
+from graphout import dot_lines, graph_lines, GRAPH_OPTIONS
 
-def schema2dot(schema):
-    dot = ["digraph Schema {"]
-    for table in schema.tables.values():
-        edges = ["\t%s -> %s;" % (table.name, r.table)
-                 for r in table.relationships.values()]
-        dot.extend(edges)
-    dot.append("}")
-    return "\n".join(dot)
+def schema_edges(schema):
+    return [(table.name, r.table) for table in schema.tables.values()
+            for r in table.relationships.values()]
+
+def schema2dot(schema, collapse=False, clustering=None):
+    return "\n".join(dot_lines(schema.tables.keys(), schema_edges(schema),
+                               "Schema", "\t", collapse, clustering))
 
 if __name__ == '__main__':
+    import getopt
     import sys
-    schema = parse_schema(sys.stdin)
-    print schema2dot(schema)
+    optlist, args = getopt.getopt(sys.argv[1:], GRAPH_OPTIONS)
+    schema = parse_schema_file(args[0]) if args else parse_schema(sys.stdin)
+    for line in graph_lines(schema.tables.keys(), schema_edges(schema),
+                            dict(optlist), "Schema", "\t"):
+        print line
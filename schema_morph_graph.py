@@ -1,5 +1,9 @@
+import json
 import re
 
+from graphout import graph_lines, GRAPH_OPTIONS
+from loadorder import strongly_connected_components
+
 relationship_re = re.compile(r"(?P<action>[nrf])\s+" +
                              r"(?P<ltable>[^\.]+)\." +
                              r"(?P<lcol>[^\s]+)\s+->\s+" +
@@ -7,7 +11,9 @@ relationship_re = re.compile(r"(?P<action>[nrf])\s+" +
                              r"(?P<rcol>[^\s]+)")
 
 def parse_relationships(data):
-    results = set()
+    # One edge per relationship line, so parallel foreign keys between two
+    # tables stay separate edges for -c to count.
+    results = []
     for line in data:
         match = relationship_re.match(line)
         assert match is not None
@@ -16,16 +22,146 @@ def parse_relationships(data):
         ltable = match.group("ltable")
 
         if action == "r":
-            results.add((rtable, ltable))
+            results.append((rtable, ltable))
         elif action == "f":
-            results.add((ltable, rtable))
+            results.append((ltable, rtable))
     return results
 
+# Each edge (container, member) asks for member rows to be stored inside
+# container documents. The analysis folds cycles into single units, drops
+# edges implied by longer paths, and groups the units into aggregates: a
+# root with the members reachable from it through single containers. A
+# unit with several containers left after the reduction can not live in
+# one document and becomes a root of its own.
+
+class Unit:
+    def __init__(self, tables):
+        self.tables = tables
+        self.name = "+".join(tables)
+        self.members = []
+        self.containers = []
+        self.root = None
+        self.aggregate = []
+
+class Analysis:
+    def __init__(self):
+        self.units = []
+        self.cycles = []
+        self.edges = []
+        self.reduced = []
+        self.aggregates = []
+        self.shared = []
+
+def analyse(edges):
+    nodes = set(n for edge in edges for n in edge)
+    deps = dict((n, []) for n in nodes)
+    for container, member in edges:
+        deps[container].append((member, None))
+
+    # Tarjan yields members before their containers.
+    analysis = Analysis()
+    unit_of = {}
+    for component in strongly_connected_components(deps):
+        unit = Unit(component)
+        analysis.units.append(unit)
+        if len(component) > 1:
+            analysis.cycles.append(unit)
+        for table in component:
+            unit_of[table] = unit
+
+    containers = {}
+    for container, member in edges:
+        c, m = unit_of[container], unit_of[member]
+        if c is not m:
+            containers.setdefault(m, set()).add(c)
+
+    # Transitive reduction over the condensed DAG. Only an edge into a unit
+    # with several containers can be implied, namely when another of its
+    # containers lies below this one; so reachability is tracked, members
+    # first, as a bit set over just those containers.
+    bit = {}
+    for m, cs in containers.items():
+        if len(cs) > 1:
+            for c in cs:
+                bit.setdefault(c, 1 << len(bit))
+    reach = {}
+    for unit in analysis.units:
+        reach[unit] = 0
+    for m in analysis.units:
+        for c in containers.get(m, ()):
+            reach[c] |= reach[m] | bit.get(m, 0)
+
+    for m in reversed(analysis.units):
+        cs = sorted(containers.get(m, ()), key=lambda u: u.name)
+        for c in cs:
+            others = sum(bit[o] for o in cs if o is not c) if len(cs) > 1 else 0
+            if reach[c] & others:
+                analysis.reduced.append((c, m))
+            else:
+                analysis.edges.append((c, m))
+                c.members.append(m)
+                m.containers.append(c)
+
+    for unit in reversed(analysis.units):
+        if len(unit.containers) == 1:
+            unit.root = unit.containers[0].root
+        else:
+            unit.root = unit
+            analysis.aggregates.append(unit)
+            if unit.containers:
+                analysis.shared.append(unit)
+        unit.root.aggregate.append(unit)
+    return analysis
+
+def read_estimates(filename):
+    # Rows and bytes per row of each table, from an importmysql -m report.
+    with open(filename) as report:
+        tables = json.load(report)["tables"]
+    return dict((t["name"], (t["rows"], float(t["bytes_written"]) / max(t["rows"], 1)))
+                for t in tables)
+
+def estimate(analysis, root, estimates):
+    # Rows and bytes of one root document: each member table contributes
+    # its rows spread evenly over the root rows.
+    root_rows = sum(estimates.get(t, (0, 0))[0] for t in root.tables)
+    if root_rows == 0:
+        return None
+    rows = nbytes = 0.0
+    for unit in root.aggregate:
+        for table in unit.tables:
+            table_rows, row_bytes = estimates.get(table, (0, 0))
+            rows += float(table_rows) / root_rows
+            nbytes += float(table_rows) / root_rows * row_bytes
+    return rows, nbytes
+
+def analysis_lines(analysis, estimates=None):
+    for unit in analysis.cycles:
+        yield "cycle: %s" % " ".join(unit.tables)
+    for container, member in analysis.reduced:
+        yield "implied: %s -> %s" % (container.name, member.name)
+    for unit in analysis.shared:
+        yield "shared: %s (in %s)" % (unit.name,
+                                      " ".join(c.name for c in unit.containers))
+    for root in analysis.aggregates:
+        members = [u.name for u in root.aggregate if u is not root]
+        line = "aggregate: %s: %s" % (root.name, " ".join(members) or "-")
+        size = estimates and estimate(analysis, root, estimates)
+        if size:
+            line += " (%.1f rows, %.0f bytes per document)" % size
+        yield line
+
 if __name__ == '__main__':
+    import getopt
     import sys
-    print "digraph G {"
-    for l, r in parse_relationships(sys.stdin):
-        print "  %s -> %s;" % (l, r)
-    print "}"
+    optlist, args = getopt.getopt(sys.argv[1:], GRAPH_OPTIONS + 'ar:')
+    options = dict(optlist)
+    edges = parse_relationships(sys.stdin)
+    if "-a" in options:
+        estimates = read_estimates(options["-r"]) if "-r" in options else None
+        lines = analysis_lines(analyse(set(edges)), estimates)
+    else:
+        lines = graph_lines([], edges, options)
+    for line in lines:
+        print line
 
 
@@ -0,0 +1,79 @@
+import cPickle as pickle
+import hashlib
+import os
+
+# Bump whenever the schema model changes shape, so older caches rebuild.
+FORMAT_VERSION = 5
+CACHE_SUFFIX = ".cache"
+HASH_CHUNK = 1 << 20
+
+# A cache file holds two pickles: a small header (format version, size and
+# mtime of the source, hash of its content) and then the schema itself, so
+# a stale cache is detected without unpickling the schema. The source is
+# only hashed once its stamp has changed: a first build records no hash,
+# and the hash then tells a touched file from an edited one. Sources that
+# build faster than they hash (mysqldumps, scanned for CREATE TABLE only)
+# skip the hash and rebuild whenever the stamp changes.
+
+def cached_schema(filename, build, cache_file=None, use_digest=True):
+    cache_file = cache_file or filename + CACHE_SUFFIX
+    stat = os.stat(filename)
+    stamp = (stat.st_size, stat.st_mtime)
+
+    header, cache = read_header(cache_file)
+    digest = None
+    try:
+        if header is not None and header["stamp"] == stamp:
+            return pickle.load(cache)
+
+        if header is not None and use_digest:
+            digest = file_digest(filename)
+        if digest is not None and header["digest"] == digest:
+            # Touched but unchanged: keep the schema, refresh the stamp.
+            schema = pickle.load(cache)
+        else:
+            schema = build(filename)
+    finally:
+        if cache is not None:
+            cache.close()
+
+    write_cache(cache_file, {"version": FORMAT_VERSION,
+                             "stamp": stamp,
+                             "digest": digest}, schema)
+    return schema
+
+def file_digest(filename):
+    digest = hashlib.sha1()
+    with open(filename, "rb") as source:
+        while True:
+            chunk = source.read(HASH_CHUNK)
+            if not chunk: break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def read_header(cache_file):
+    try:
+        cache = open(cache_file, "rb")
+    except IOError:
+        return None, None
+    try:
+        header = pickle.load(cache)
+        if header.get("version") == FORMAT_VERSION:
+            return header, cache
+    except Exception:
+        pass
+    cache.close()
+    return None, None
+
+def write_cache(cache_file, header, schema):
+    # Written aside and renamed so concurrent readers never see a partial
+    # cache. A cache that can not be written is simply not used.
+    temp_file = "%s.%d" % (cache_file, os.getpid())
+    try:
+        with open(temp_file, "wb") as out:
+            pickle.dump(header, out, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(schema, out, pickle.HIGHEST_PROTOCOL)
+        os.rename(temp_file, cache_file)
+    except (IOError, OSError):
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
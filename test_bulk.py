@@ -0,0 +1,83 @@
+import json
+import threading
+import unittest
+
+from benchmark import FakeCouchServer, FakeCouchHandler
+from bulk import BulkWriter, ConcurrentWriter, BatchBudget, HttpSink
+
+class CountingHandler(FakeCouchHandler):
+    def do_POST(self):
+        if self.path.endswith("/_bulk_docs"):
+            self.server.bulk_requests += 1
+        FakeCouchHandler.do_POST(self)
+
+class CountingServer(FakeCouchServer):
+    # Counts accepted connections and _bulk_docs requests.
+    def __init__(self, address):
+        FakeCouchServer.__init__(self, address)
+        self.RequestHandlerClass = CountingHandler
+        self.connections = 0
+        self.bulk_requests = 0
+
+    def process_request(self, request, client_address):
+        self.connections += 1
+        FakeCouchServer.process_request(self, request, client_address)
+
+def make_docs(n, size=100):
+    return [{"_id": "doc-%05d" % i, "value": "x" * size} for i in range(n)]
+
+class HttpSinkTest(unittest.TestCase):
+    def setUp(self):
+        self.server = CountingServer(("127.0.0.1", 0))
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = "http://127.0.0.1:%d/test" % self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_batches_by_bytes(self):
+        writer = BulkWriter(HttpSink(self.url), BatchBudget(10000))
+        writer.add(make_docs(500))
+        writer.close()
+        self.assertEqual(len(self.server.docs), 500)
+        self.assertEqual(writer.stats.docs, 500)
+        self.assertEqual(writer.stats.requests, self.server.bulk_requests)
+        self.assertTrue(writer.stats.requests > 1)
+        self.assertTrue(writer.stats.max_docs < 500)
+
+    def test_conflict_results(self):
+        sink = HttpSink(self.url)
+        self.assertEqual(sink.bulk_docs([json.dumps(d) for d in make_docs(3)]), [])
+        docs = make_docs(4)
+        failures = sink.bulk_docs([json.dumps(d) for d in docs])
+        self.assertEqual([(index, error) for index, error, reason in failures],
+                         [(0, "conflict"), (1, "conflict"), (2, "conflict")])
+        self.assertEqual(sorted(sink.revisions([d["_id"] for d in docs])),
+                         ["doc-00000", "doc-00001", "doc-00002", "doc-00003"])
+
+    def test_conflicts_overwritten_serial_and_concurrent(self):
+        for make_writer in (lambda sink: BulkWriter(sink, BatchBudget(1000)),
+                            lambda sink: ConcurrentWriter(sink, 3, BatchBudget(1000))):
+            self.server.docs.clear()
+            for size in (100, 20):
+                writer = make_writer(HttpSink(self.url, 3))
+                writer.add(make_docs(10, size))
+                writer.close()
+            self.assertEqual(len(self.server.docs), 10)
+            for doc in self.server.docs.values():
+                self.assertEqual(doc["value"], "x" * 20)
+                self.assertEqual(doc["_rev"], "2-fake")
+
+    def test_connection_reuse(self):
+        writer = ConcurrentWriter(HttpSink(self.url, 2), 2, BatchBudget(1000))
+        writer.add(make_docs(300))
+        writer.close()
+        self.assertEqual(len(self.server.docs), 300)
+        self.assertTrue(self.server.bulk_requests > 10)
+        self.assertTrue(self.server.connections <= 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+
+from joinquery import Joiner, incoming, js_string
+from joins import join_emits
+from schema import Schema, Table, Column, make_relationship
+
+class Row:
+    def __init__(self, key, doc):
+        self.key = key
+        self.id = doc["_id"]
+        self.doc = doc
+
+class FakeDatabase:
+    # Answers view queries with the rows joins.compute_view would emit.
+    def __init__(self, schema, docs):
+        emits = join_emits(schema)
+        self.rows = []
+        for doc in docs:
+            lh_emits, rh_emits = emits.get(doc["type"], ((), ()))
+            for column, key in lh_emits:
+                if doc.get(column) is not None:
+                    self.rows.append(Row([key + js_string(doc[column]), 1], doc))
+            for column in rh_emits:
+                if doc.get(column) is not None:
+                    self.rows.append(Row(["%s.%s%s" % (doc["type"], column,
+                                                       js_string(doc[column])), 0], doc))
+
+    def view(self, name, keys, **options):
+        return [row for key in keys for row in self.rows if row.key == key]
+
+def agent_schema():
+    schema = Schema()
+    agent = schema.tables["agent"] = Table("agent")
+    agent.primary_key = "AgentID"
+    agent.columns["AgentID"] = Column("AgentID", "int(11)", "NOT NULL")
+    co = schema.tables["co"] = Table("co")
+    co.primary_key = "CoID"
+    for name in ("CoID", "CreatedByAgentID", "ModifiedByAgentID"):
+        co.columns[name] = Column(name, "int(11)", "DEFAULT NULL")
+    for name in ("CreatedByAgentID", "ModifiedByAgentID"):
+        co.relationships[name] = make_relationship(
+            "FK" + name, [name], "agent", ["AgentID"])
+    return schema
+
+def agent(i):
+    return {"_id": "agent.%d" % i, "type": "agent", "AgentID": i}
+
+def co(i, created, modified):
+    return {"_id": "co.%d" % i, "type": "co", "CoID": i,
+            "CreatedByAgentID": created, "ModifiedByAgentID": modified}
+
+class TwoForeignKeysTest(unittest.TestCase):
+    def setUp(self):
+        self.schema = agent_schema()
+        self.agents = [agent(1), agent(2)]
+        self.db = FakeDatabase(self.schema, self.agents + [
+                co(1, 1, 2), co(2, 2, 2), co(3, 1, None)])
+        self.children = incoming(self.schema, "agent")
+
+    def referrer_ids(self, children):
+        joined = Joiner(self.db).join(self.agents, children=children)
+        return dict((doc["_id"], dict((name, [d["_id"] for d in docs])
+                                      for name, docs in record.items()))
+                    for doc, record in joined)
+
+    def test_referrers_split_by_foreign_key(self):
+        self.assertEqual(self.referrer_ids(self.children), {
+                "agent.1": {"co.CreatedByAgentID": ["co.1", "co.3"],
+                            "co.ModifiedByAgentID": []},
+                "agent.2": {"co.CreatedByAgentID": ["co.2"],
+                            "co.ModifiedByAgentID": ["co.1", "co.2"]}})
+
+    def test_one_foreign_key(self):
+        created = [(t, r) for t, r in self.children
+                   if r.local_column == "CreatedByAgentID"]
+        self.assertEqual(self.referrer_ids(created), {
+                "agent.1": {"co.CreatedByAgentID": ["co.1", "co.3"]},
+                "agent.2": {"co.CreatedByAgentID": ["co.2"]}})
+
+    def test_references(self):
+        co_table = self.schema.tables["co"]
+        joined = dict((doc["_id"], record) for doc, record in Joiner(self.db).join(
+                [co(1, 1, 2)], co_table.relationships.values()))
+        self.assertEqual(joined["co.1"]["CreatedByAgentID"]["_id"], "agent.1")
+        self.assertEqual(joined["co.1"]["ModifiedByAgentID"]["_id"], "agent.2")
+
+if __name__ == "__main__":
+    unittest.main()
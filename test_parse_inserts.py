@@ -0,0 +1,48 @@
+import unittest
+
+from parse_inserts import index_dump, statements, column_converter
+
+# As mysqldump writes them: BIT(1) values are raw bytes inside quotes
+# (5.x), _binary strings (8.0), or b'' / hex literals with --hex-blob.
+DUMP = ("-- MySQL dump 10.13\n"
+        "CREATE TABLE `agent` (\n"
+        "  `AgentID` int(11) NOT NULL AUTO_INCREMENT,\n"
+        "  `IsCurrent` bit(1) DEFAULT NULL,\n"
+        "  `LastName` varchar(64) DEFAULT NULL,\n"
+        "  PRIMARY KEY (`AgentID`)\n"
+        ") ENGINE=InnoDB;\n"
+        "INSERT INTO `agent` VALUES (1,'\x01','Smith'),(2,'\\0','O\\'Neil'),"
+        "(3,_binary '\x01',NULL),(4,_binary '\\0','Lee');\n"
+        "INSERT INTO `agent` VALUES (5,b'1','Ng'),(6,b'0','Li'),"
+        "(7,0x01,'Wu'),(8,NULL,'Xu');\n")
+
+def convert_rows(dump, table, types):
+    columns, sections = index_dump(dump)
+    converters = [column_converter(t) for t in types]
+    return [[None if v is None else convert(v) for convert, v in zip(converters, row)]
+            for names, rows in statements(dump, sections[table], columns[table])
+            for row in rows]
+
+class BitColumnTest(unittest.TestCase):
+    def test_bit_values(self):
+        rows = convert_rows(DUMP, "agent", ["int(11)", "bit(1)", "varchar(64)"])
+        self.assertEqual([row[1] for row in rows],
+                         [True, False, True, False, True, False, True, None])
+        self.assertEqual(rows[1], [2, False, u"O'Neil"])
+
+class IndexDumpTest(unittest.TestCase):
+    def test_statements_at_offset_zero(self):
+        dump = DUMP[DUMP.index("CREATE TABLE"):]
+        columns, sections = index_dump(dump)
+        self.assertEqual(columns["agent"], ["AgentID", "IsCurrent", "LastName"])
+
+        inserts = dump[dump.index("INSERT INTO"):]
+        columns, sections = index_dump(inserts)
+        self.assertEqual(sections["agent"], [(0, len(inserts) - 1)])
+        rows = [row for names, rows in statements(inserts, sections["agent"],
+                                                  ["AgentID", "IsCurrent", "LastName"])
+                for row in rows]
+        self.assertEqual(len(rows), 8)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from cStringIO import StringIO
+
+from benchmark import generate_database, connect_sqlite
+from jsonschema import SchemaEncoder, json2schema
+from parse_schema import parse_schema
+from reflect_schema import reflect_schema, column_options
+
+DUMP = """
+CREATE TABLE `agent` (
+  `AgentID` int(11) NOT NULL AUTO_INCREMENT,
+  `LastName` varchar(64) DEFAULT NULL,
+  `Title` varchar(50) NOT NULL DEFAULT 'none',
+  `Remarks` text DEFAULT NULL,
+  `Photo` mediumblob DEFAULT NULL,
+  `TimestampCreated` datetime NOT NULL,
+  `ParentID` int(11) DEFAULT NULL,
+  PRIMARY KEY (`AgentID`),
+  UNIQUE KEY `LastTitle` (`LastName`,`Title`),
+  KEY `FKParent` (`ParentID`),
+  CONSTRAINT `FKParent` FOREIGN KEY (`ParentID`) REFERENCES `agent` (`AgentID`)
+) ENGINE=InnoDB;
+CREATE TABLE `address` (
+  `AddressID` int(11) NOT NULL AUTO_INCREMENT,
+  `AgentID` int(11) NOT NULL,
+  `Address` varchar(255) DEFAULT NULL,
+  PRIMARY KEY (`AddressID`),
+  KEY `FKAgent` (`AgentID`),
+  CONSTRAINT `FKAgent` FOREIGN KEY (`AgentID`) REFERENCES `agent` (`AgentID`)
+) ENGINE=InnoDB;
+"""
+
+def schema_dict(schema):
+    return json.loads(json.dumps(schema, cls=SchemaEncoder))
+
+class ReflectSchemaTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_matches_parsed_schema(self):
+        # The JSON schema of a dump, loaded into the SQLite fixture and
+        # reflected back from its information_schema.
+        expected = schema_dict(parse_schema(StringIO(DUMP)))
+        db = os.path.join(self.directory, "reflect.sqlite")
+        generate_database(json2schema(expected), db, 10)
+        self.assertEqual(schema_dict(reflect_schema(connect_sqlite(db))), expected)
+
+    def test_column_options(self):
+        self.assertEqual(column_options("text", True, None, ""), "DEFAULT NULL")
+        self.assertEqual(column_options("int(11)", False, None, "auto_increment"),
+                         "NOT NULL AUTO_INCREMENT")
+        self.assertEqual(column_options("varchar(50)", False, "it's", ""),
+                         "NOT NULL DEFAULT 'it\\'s'")
+        self.assertEqual(column_options("timestamp", False, "CURRENT_TIMESTAMP",
+                                        "DEFAULT_GENERATED"),
+                         "NOT NULL DEFAULT CURRENT_TIMESTAMP")
+
+if __name__ == "__main__":
+    unittest.main()